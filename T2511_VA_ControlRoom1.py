@@ -2,16 +2,62 @@
 """
 Simple Raspberry Pi serial (RX) reader.
 
-Reads from a serial device (default `/dev/serial0`) and prints received
+Reads from a serial device (default `/dev/serial0`) and logs received
 lines with timestamps. Designed to run on a Raspberry Pi using the
 primary UART or a USB-serial adapter.
 
 Usage:
-  python3 serial-test1.py --port /dev/ttyUSB0 --baud 115200
+  python3 T2511_VA_ControlRoom1.py --port /dev/ttyUSB0 --baud 115200
+  python3 T2511_VA_ControlRoom1.py --port /dev/ttyUSB0 --baud 9600 --port /dev/ttyUSB1 --baud 115200
+  python3 T2511_VA_ControlRoom1.py --port /dev/ttyUSB0 --framing binary
+  python3 T2511_VA_ControlRoom1.py --headless --port /dev/ttyUSB0
+  python3 T2511_VA_ControlRoom1.py --attach
+
+--headless runs only the serial ingestion and status evaluation, without
+a window, and publishes the sensor table into the shared-memory segment
+--shm (see shm_snapshot.py). --attach opens the dashboard as a viewer of
+that segment instead of reading the serial ports itself; any number of
+viewers and snapshot-view.py can follow one daemon. A viewer shows the
+rows OUTDATED when the daemon stops publishing and follows a restarted
+daemon to its new segment. A second daemon on the same --shm refuses to
+start.
+
+--framing picks ascii <node;TAG;Type;value> lines (the default), the
+12-byte binary frames with a CRC of binary_frames.py, or auto, which
+decides from the first frames a port sends. Like --baud it is given per
+--port, the last one applies to the rest.
+
+--http PORT serves the table as JSON in any mode (see status_http.py):
+GET /sensors, GET /sensors/<tag>/history?seconds=3600,
+GET /sensors/<tag>/rollup?res=1h&seconds=604800 (min/max/mean buckets of
+rollups.py, res 1m, 1h or 1d; an --attach viewer's are sampled once per
+poll) and the server-sent-events stream
+GET /events.
+
+Diagnostics in the menu bar shows how long readings take from the serial
+read to the reconfigured label, per stage (latency_stats.py), with the
+throughput counters; the summary log carries the same percentiles.
+
+--profile DIR profiles the ingest thread and the Tk main loop with
+cProfile, each on its own (Python 3.12 and later allow only one profiler
+per process, there it is one report for all threads), and writes
+tracemalloc growth reports every --profile-interval seconds (see
+profiling.py). The profiles are written
+on exit and whenever the process gets SIGUSR1:
+  kill -USR1 $(pgrep -f T2511_VA_ControlRoom1.py)
 
 Environment variables (optional):
   SERIAL_PORT  - serial device path (overrides --port)
   SERIAL_BAUD  - baud rate (overrides --baud)
+  SENSOR_FILE  - sensor definitions (default sensor_dict.json)
+  LOG_LEVEL    - DEBUG, INFO, WARNING or ERROR (overrides --log-level)
+  SHM_NAME     - shared-memory segment name (overrides --shm)
+  HTTP_PORT    - JSON API port (overrides --http)
+
+Ingestion events are logged as "event key=value ..." lines. Raw frames
+are only logged at DEBUG; at INFO a summary with the frame rate, the
+per-port counters and the sensor table comes every --summary-interval
+seconds. Under systemd the journal adds the timestamps.
 
 Requires: pyserial
 """
@@ -19,141 +65,327 @@ Requires: pyserial
 from __future__ import annotations
 
 import argparse
+import logging
 import os
-import sys
+import signal
 import tkinter as tk
 from tkinter import simpledialog
-from threading import Thread
+from threading import Thread, Lock, Event
 import time
 from datetime import datetime
-from datetime import timedelta
-import json
+
+from sensor_registry import SensorRegistry, load_definitions, write_definitions
+from frame_parser import FrameParser
+from binary_frames import BinaryFrameParser, AutoFrameParser
+from sensor_history import SensorHistory
+from history_log import HistoryLog
+from history_sqlite import SqliteHistory
+from trend_window import TrendWindow
+from derived_metrics import DerivedEngine
+from rollups import Rollups, RESOLUTIONS
+from shm_snapshot import SnapshotWriter, SnapshotReader, DEFAULT_CAPACITY
+from status_http import StatusServer, TableCache
+from event_stream import EventHub
+from latency_stats import LatencyStats
+from diagnostics_window import DiagnosticsWindow
+from profiling import Profiler
+from sensor_status import (StatusEngine, STATUS_NAMES, SENSOR_STATUS_OK, SENSOR_STATUS_NO_DATA,
+                           SENSOR_STATUS_OUTDATED, SENSOR_STATUS_HIGH_TEMPERATURE,
+                           SENSOR_STATUS_LOW_TEMPERATURE)
 
 try:
-    import serial
-    from serial.serialutil import SerialException
+    import serial   # only checks that pyserial is installed
 except Exception as e:
     print("Missing dependency: pyserial. Install with: pip install pyserial")
     raise
 
-sensors = {
-    
-    'LA1_T':    {'Sensor': 'Lilla Astrid  ', 'Type':'Temp','Value':0.0, 'Min':10.0, 'Max': 30.0, 'Updated':''},
-    'LA2_T':    {'Sensor': 'Studio        ', 'Type':'Temp','Value':0.0, 'Min':14.0, 'Max': 28.0, 'Updated':''},
-    'VA1_T':    {'Sensor': 'MH1           ', 'Type':'Temp','Value':0.0, 'Min':10.0, 'Max': 30.0, 'Updated':''},
-    'VA1_H':    {'Sensor': 'MH1           ', 'Type':'Hum', 'Value':0.0, 'Min':10.0, 'Max': 30.0, 'Updated':''},
-    'VA2_T':    {'Sensor': 'MH2           ', 'Type':'Temp','Value':0.0, 'Min':10.0, 'Max': 30.0, 'Updated':''},
-    'VA3_T':    {'Sensor': 'Parvi         ', 'Type':'Temp','Value':0.0, 'Min':10.0, 'Max': 30.0, 'Updated':''},
-    'LH_T':     {'Sensor': 'Lilla Astrid  ', 'Type':'Temp','Value':0.0, 'Min':10.0, 'Max': 30.0, 'Updated':''},
-    'OD1_T':    {'Sensor': 'Outdoor       ', 'Type':'Temp','Value':0.0, 'Min':10.0, 'Max': 30.0, 'Updated':''},
-    'Water_T':  {'Sensor': 'Vesi -1m      ', 'Type':'Temp','Value':0.0, 'Min':10.0, 'Max': 30.0, 'Updated':''}
-}
-
-with open("sensor_dict.json","w") as fp:
-    json.dump(sensors,fp)
-
-msg_tags = list(sensors.keys())
-print (msg_tags)
-nbr_of_sensors = len(msg_tags)
-
-def print_sensors():
-    print("{0:8s} {1:14s} {2:6s} {3:4s} {4}".format('Sensor','Location','Value', 'Hum', 'Updated'))
-    for key in sensors.keys():
-        # print ("{0:8s} {1:12s} {2:4.1f} {3:4.0f} {4}".format(key, sensors[key]['Sensor'], sensors[key]['Temp'], sensors[key]['Hum'],sensors[key]['Updated']))
-        print(format_sensor(key))
-
-def format_sensor(key) -> str:
-    s = "{0:8s} {1:12s}".format(key, sensors[key]['Sensor'], )
-    if 'Type' in sensors[key].keys():
-        if sensors[key]['Type'] == 'Temp':       
-            s = s + " Temp {0:4.1f}C ".format(sensors[key]['Value'])
-        elif sensors[key]['Type'] == 'Hum':       
-            s = s + " Hum {0:4.0f}KPa ".format(sensors[key]['Value'])
-    try:
-        s = s + "  < {0}".format(sensors[key]['Updated'].strftime("%Y-%m-%d %H:%M:%S"))
-    except:
+from serial_mux import SerialPort
+from serial_engine import IngestEngine
+
+log = logging.getLogger("controlroom")
+
+SENSOR_FILE = os.getenv("SENSOR_FILE", "sensor_dict.json")
+
+sensors = SensorRegistry.load(SENSOR_FILE)
+status_engine = StatusEngine(sensors)
+derived_engine = DerivedEngine(sensors)
+# Minute, hour and local-day min/max/mean per sensor, fed by apply_reading()
+rollups = Rollups(len(sensors))
+
+# Held by the ingest thread while a burst of frames is applied and by the
+# Tk main loop while the rows are repainted
+sensors_lock = Lock()
+
+# Set by threshold edits, the definitions writer thread saves sensor_dict.json;
+# a save clears it and writes under definitions_lock, so the last save at
+# exit never overlaps the thread's and no edit falls between them
+save_requested = Event()
+definitions_lock = Lock()
+
+# Ids of the sensors whose row needs repainting, filled by mark_dirty()
+# and status_engine.expire(), drained by refresh_labels()
+dirty_ids = set(range(len(sensors)))
+
+# Bumped on every change to the table, the HTTP cache serializes once per value
+table_version = 0
+# Change events for GET /events, created with the HTTP server
+event_hub = None
+
+# Per-sensor ring buffers, allocated in main() once --history-size is known
+history = None
+# One SerialPort per --port, all served by the IngestEngine thread
+serial_ports = []
+# --hex: raw frames are logged as hex at DEBUG level
+raw_hex = False
+# Persistent stores that get every applied reading: append(tag, ts, value)
+# from history_writer(), flush_if_due() on an engine timer, close() on exit
+history_sinks = []
+# Stage durations of the readings on their way to the screen: parse (serial
+# read to frames parsed), status (to values applied and status evaluated),
+# paint (to label reconfigured) and total (serial read to label)
+latency = LatencyStats(("parse", "status", "paint", "total"), ("blocks", "readings", "repaints", "labels"))
+# tid -> (read, status evaluated) monotonic times of its oldest reading not
+# painted yet, filled by parse_frames(), drained by refresh_labels()
+unpainted = {}
+# --profile: cProfile and tracemalloc reports, None when off
+profiler = None
+
+def sensor_table() -> str:
+    lines = ["{0:8s} {1:14s} {2:6s} {3:4s} {4}".format('Sensor','Location','Value', 'Hum', 'Updated')]
+    for tid in sensors.active_ids():
+        lines.append(format_sensor(tid))
+    return "\n".join(lines)
+
+def format_sensor(tid) -> str:
+    s = "{0:8s} {1:14s}".format(sensors.tags[tid], sensors.locations[tid])
+    if sensors.types[tid] == 'Temp':
+        s = s + " Temp {0:4.1f}C ".format(sensors.values[tid])
+    elif sensors.types[tid] == 'Hum':
+        s = s + " Hum {0:4.0f}KPa ".format(sensors.values[tid])
+    else:
+        s = s + " {0} {1:5.1f} ".format(sensors.types[tid], sensors.values[tid])
+    if sensors.updated[tid]:
+        s = s + "  < {0}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sensors.updated[tid])))
+    else:
         s = s + "  < ---"
     return (s)
 
-SENSOR_STATUS_OK = 0
-SENSOR_STATUS_NO_DATA = 1
-SENSOR_STATUS_OUTDATED = 2
-SENSOR_STATUS_HIGH_TEMPERATURE = 3
-SENSOR_STATUS_LOW_TEMPERATURE = 4
-
-def get_sensor_status(key):
-    status = SENSOR_STATUS_OK
-    if sensors[key]['Updated']:
-        status = SENSOR_STATUS_OK 
-        diff = datetime.now() - sensors[key]['Updated']
-        if diff.total_seconds() > 45:
-            status = SENSOR_STATUS_OUTDATED
-        elif sensors[key]['Value'] < sensors[key]['Min']:
-            status = SENSOR_STATUS_LOW_TEMPERATURE
-        elif sensors[key]['Value'] > sensors[key]['Max']:
-            status = SENSOR_STATUS_HIGH_TEMPERATURE
-            
-    else:
-        status = SENSOR_STATUS_NO_DATA
-    return (status) 
+# https://www.plus2net.com/python/tkinter-colors.php
+STATUS_COLORS = {
+    SENSOR_STATUS_OK:               ('green', 'white'),
+    SENSOR_STATUS_NO_DATA:          ('grey', 'black'),
+    SENSOR_STATUS_OUTDATED:         ('chocolate', 'black'),
+    SENSOR_STATUS_LOW_TEMPERATURE:  ('cyan', 'black'),
+    SENSOR_STATUS_HIGH_TEMPERATURE: ('crimson', 'gold1'),
+}
+
+def get_sensor_status(tid):
+    return status_engine.status[tid]
 
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Raspberry Pi serial RX reader")
-    p.add_argument("--port", "-p", default=os.getenv("SERIAL_PORT", "/dev/serial0"),
-                   help="Serial device (default from $SERIAL_PORT or /dev/serial0)")
-    p.add_argument("--baud", "-b", type=int, default=int(os.getenv("SERIAL_BAUD", "9600")),
-                   help="Baud rate (default from $SERIAL_BAUD or 9600)")
+    p.add_argument("--port", "-p", action="append",
+                   help="Serial device, repeat for several gateways (default from $SERIAL_PORT or /dev/serial0)")
+    p.add_argument("--baud", "-b", type=int, action="append",
+                   help="Baud rate of the matching --port, the last one applies to the rest "
+                        "(default from $SERIAL_BAUD or 9600)")
+    p.add_argument("--framing", action="append", choices=("ascii", "binary", "auto"),
+                   help="Frame format of the matching --port, the last one applies to the rest (default ascii)")
     p.add_argument("--timeout", "-t", type=float, default=1.0,
-                   help="Read timeout in seconds (default 1.0)")
+                   help="Interval of the history flush check in seconds (default 1.0)")
     p.add_argument("--hex", action="store_true",
-                   help="Print incoming bytes as hex instead of UTF-8 decoded lines")
-    return p.parse_args()
-
-
-def open_serial(port: str, baud: int, timeout: float) -> serial.Serial:
-    try:
-        ser = serial.Serial(port=port, baudrate=baud, timeout=timeout)
-        return ser
-    except SerialException as e:
-        print(f"Failed to open serial port {port}: {e}")
-        raise
+                   help="Log raw frames as hex at DEBUG level")
+    p.add_argument("--refresh-ms", type=int, default=1000,
+                   help="Dashboard repaint interval in milliseconds (default 1000)")
+    p.add_argument("--reload-ms", type=int, default=2000,
+                   help="How often to check the sensor file for changes in milliseconds (default 2000)")
+    p.add_argument("--history-size", type=int, default=int(os.getenv("HISTORY_SIZE", "8640")),
+                   help="Readings kept in memory per sensor (default from $HISTORY_SIZE or 8640)")
+    p.add_argument("--history-dir", default=os.getenv("HISTORY_DIR", ""),
+                   help="Directory for the binary history log (default from $HISTORY_DIR, off if empty)")
+    p.add_argument("--history-db", default=os.getenv("HISTORY_DB", ""),
+                   help="SQLite history database file (default from $HISTORY_DB, off if empty)")
+    p.add_argument("--retention-days", type=float, default=0.0,
+                   help="Delete SQLite history older than this many days (default 0, keep all)")
+    p.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "INFO").upper(),
+                   choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                   help="Logging level (default from $LOG_LEVEL or INFO)")
+    p.add_argument("--summary-interval", type=float, default=60.0,
+                   help="Seconds between the summary log entries, 0 turns them off (default 60)")
+    p.add_argument("--headless", action="store_true",
+                   help="Run the ingestion without a window and publish the table into --shm")
+    p.add_argument("--attach", action="store_true",
+                   help="Show the table published by a --headless daemon instead of reading serial ports")
+    p.add_argument("--shm", default=os.getenv("SHM_NAME", "va_controlroom"),
+                   help="Shared-memory segment name (default from $SHM_NAME or va_controlroom)")
+    p.add_argument("--shm-capacity", type=int, default=DEFAULT_CAPACITY,
+                   help="Most sensors the segment can hold (default %(default)s)")
+    p.add_argument("--http", type=int, default=int(os.getenv("HTTP_PORT", "0")),
+                   help="Serve the sensor table as JSON on this TCP port (default from $HTTP_PORT, off if 0)")
+    p.add_argument("--http-bind", default="",
+                   help="Address the HTTP server listens on (default: all interfaces)")
+    p.add_argument("--sse-replay", type=int, default=1000,
+                   help="Change events kept for reconnecting /events clients (default 1000)")
+    p.add_argument("--profile", nargs='?', const="profile", default="", metavar="DIR",
+                   help="Profile the ingest thread and the Tk loop (one profile for both on Python 3.12+) "
+                        "and trace allocations, "
+                        "reports go to DIR (default ./profile) on exit and on SIGUSR1")
+    p.add_argument("--profile-interval", type=float, default=60.0,
+                   help="Seconds between the --profile memory snapshots (default 60)")
+    args = p.parse_args()
+    if not args.port:
+        args.port = [os.getenv("SERIAL_PORT", "/dev/serial0")]
+    if not args.baud:
+        args.baud = [int(os.getenv("SERIAL_BAUD", "9600"))]
+    args.baud += [args.baud[-1]] * (len(args.port) - len(args.baud))
+    if not args.framing:
+        args.framing = ["ascii"]
+    args.framing += [args.framing[-1]] * (len(args.port) - len(args.framing))
+    return args
 
 
 def format_ts() -> str:
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")[:-3]
 
-def open_config_window(root, tag):
-    selected_tag =tag
+def setup_logging(args):
+    # journald timestamps every line itself
+    fmt = "%(levelname)s %(name)s: %(message)s"
+    if not os.getenv("JOURNAL_STREAM"):
+        fmt = "%(asctime)s " + fmt
+    logging.basicConfig(level=args.log_level, format=fmt)
+
+def recent_history(tid, t0):
+    """In-memory readings of sensor tid with ts >= t0"""
+    with sensors_lock:
+        return history.buffers[tid].since(t0)
+
+
+def history_query(tid, t0, t1):
+    """
+    Readings of sensor tid for t0 <= ts < t1. The ring buffer answers for the
+    recent part, the first persistent sink for whatever is older than it holds.
+    """
+    with sensors_lock:
+        buf = history.buffers[tid]
+        oldest = buf.first()
+        times, values = buf.since(t0)
+    if oldest is not None and oldest[0] <= t0:
+        return times, values
+    end = oldest[0] if oldest is not None else t1
+    for sink in history_sinks:
+        old_times, old_values = sink.query(sensors.tags[tid], t0, end)
+        return old_times + times, old_values + values
+    return times, values
+
+
+def sensor_state(tid) -> dict:
+    """The changing fields of one sensor, as sent by the HTTP API and /events"""
+    return {'value': sensors.values[tid] if sensors.updated[tid] else None,
+            'min': sensors.mins[tid], 'max': sensors.maxs[tid],
+            'updated': sensors.updated[tid] or None,
+            'status': STATUS_NAMES[get_sensor_status(tid)]}
+
+
+def sensor_table_json() -> dict:
+    """The active sensors for GET /sensors"""
+    with sensors_lock:
+        return {'version': table_version, 'sensors': [
+            dict(tag=sensors.tags[tid], location=sensors.locations[tid], type=sensors.types[tid],
+                 **sensor_state(tid))
+            for tid in sensors.active_ids()]}
+
+
+def push_changes(ids):
+    """Publish the current state of ids to the /events stream, sensors_lock held"""
+    if event_hub is not None:
+        event_hub.publish({sensors.tags[tid]: sensor_state(tid) for tid in ids})
+
+
+def tag_history(tag, seconds):
+    """In-memory readings of tag for GET /sensors/<tag>/history, None if unknown"""
+    tid = sensors.ids.get(tag)
+    if tid is None or not sensors.active[tid]:
+        return None
+    return recent_history(tid, time.time() - seconds)
+
+
+def tag_rollup(tag, resolution, seconds):
+    """Rollup buckets of tag for GET /sensors/<tag>/rollup, None if unknown"""
+    tid = sensors.ids.get(tag)
+    if tid is None or not sensors.active[tid]:
+        return None
+    now = time.time()
+    with sensors_lock:
+        return rollups.series(tid, resolution, now - seconds, now)
+
+
+def start_http(args) -> StatusServer:
+    global event_hub
+    event_hub = EventHub(args.sse_replay)
+    server = StatusServer((args.http_bind, args.http), TableCache(lambda: table_version, sensor_table_json),
+                          tag_history, event_hub, tag_rollup, RESOLUTIONS)
+    server.start()
+    log.info("http_start bind=%s port=%d", args.http_bind or '*', args.http)
+    return server
+
+
+def open_trend_window(root, tid):
+    TrendWindow(root, sensors, tid, history_query, recent_history)
+
+
+def open_config_window(root, tid):
+    tag = sensors.tags[tid]
     conf_window = tk.Toplevel(root)
     conf_window.title = ('Configurate:',tag)
     conf_window.geometry('600x400')
 
-    print(tag,sensors[tag]['Min'],sensors[tag]['Max'])
-    label_sensor = tk.Label(conf_window, text=tag+sensors[tag]['Sensor'], font=('Arial',12))
+    log.debug("config_open tag=%s min=%g max=%g", tag, sensors.mins[tid], sensors.maxs[tid])
+    label_sensor = tk.Label(conf_window, text=tag+' '+sensors.locations[tid], font=('Arial',12))
     label_sensor.grid(row=0,column=1,pady=10, sticky='w')
         
-    var_max = tk.StringVar(value=sensors[tag]['Max'])
+    var_max = tk.StringVar(value=sensors.maxs[tid])
     label_max_value = tk.Label(conf_window, text="Max Value", font=('Arial',12))
     label_max_value.grid(row=1,column=0,pady=10, sticky='w')
     entry_max_value = tk.Entry(conf_window, textvariable = var_max, width=30)
     entry_max_value.grid(row=1,column=1,pady=5, padx=10)
 
-    var_min = tk.StringVar(value=sensors[tag]['Min'])
+    var_min = tk.StringVar(value=sensors.mins[tid])
     label_min_value = tk.Label(conf_window, text="Min Value", font=('Arial',12))
     label_min_value.grid(row=2,column=0,pady=10, sticky='w')
     entry_min_value = tk.Entry(conf_window, textvariable = var_min, width=30)
     entry_min_value.grid(row=2,column=1,pady=5, padx=10)
+
+    with sensors_lock:
+        today = rollups.today(tid)
+    if today is None:
+        text = "no readings today"
+    else:
+        text = "{0:.1f} / {1:.1f}  (mean {2:.1f}, {3} readings)".format(*today)
+    label_today = tk.Label(conf_window, text="Today low/high", font=('Arial',12))
+    label_today.grid(row=4,column=0,pady=10, sticky='w')
+    label_today_value = tk.Label(conf_window, text=text, font=('Arial',12))
+    label_today_value.grid(row=4,column=1,pady=10, padx=10, sticky='w')
          
     def accept_min():
-        sensors[tag]['Min'] = float(entry_min_value.get())
+        with sensors_lock:
+            sensors.mins[tid] = float(entry_min_value.get())
+            status_engine.thresholds_changed(tid)
+            mark_dirty((tid,))
+            push_changes((tid,))
+        save_requested.set()
 
     def accept_max():
-        sensors[tag]['Max'] = float(entry_max_value.get())
+        with sensors_lock:
+            sensors.maxs[tid] = float(entry_max_value.get())
+            status_engine.thresholds_changed(tid)
+            mark_dirty((tid,))
+            push_changes((tid,))
+        save_requested.set()
 
     def accept():
         values = [field.get() for field in fields]
-        print(f"Values: {values}")
+        log.debug("config_values values=%s", values)
         conf_window.destroy()
         
     def exit_window():
@@ -164,92 +396,445 @@ def open_config_window(root, tag):
     btn_min_value = tk.Button(conf_window, text='Accept', command = accept_min)
     btn_min_value.grid(row=2,column=2,pady=10, padx=10)
 
+    btn_trend = tk.Button(conf_window, text='Trend', command=lambda: open_trend_window(root, tid))
+    btn_trend.grid(row=3,column=0,pady=10, padx=10)
+
     btn_exit = tk.Button(conf_window, text='Exit', command=exit_window)
     btn_exit.grid(row=3,column=2,pady=10, padx=10)
 
- 
-def parse_line(line):
+
+
+def mark_dirty(ids):
+    """Queue rows for repaint and move the table version, sensors_lock held"""
+    global table_version
+    dirty_ids.update(ids)
+    table_version += 1
+
+
+def apply_reading(tid, value, ts, mono):
+    sensors.values[tid] = value
+    sensors.updated[tid] = ts
+    status_engine.on_reading(tid, mono)
+    rollups.update(tid, ts, value)
+    if history is not None:
+        history.append(tid, ts, value)
+
+
+def apply_derived(changed, ts, mono) -> list:
+    """
+    Evaluate and apply the derived sensors fed by changed, return their
+    [(tid, value)]. A derived sensor whose rule failed shows NO_DATA until
+    it computes again. sensors_lock held.
+    """
+    derived = derived_engine.evaluate(changed, ts)
+    for tid, value in derived:
+        apply_reading(tid, value, ts, mono)
+    failed = derived_engine.failed
+    if failed:
+        for tid in failed:
+            status_engine.forget(tid)
+        mark_dirty(failed)
+        push_changes(failed)
+    return derived
+
+
+def parse_frames(block, parser, read_at=None):
+    """
+    Apply a burst of complete frames and the derived sensors they feed to
+    the sensor table in one batch and return it as (ts, [(tid, value)],
+    stamps) for the engine subscribers, None if the block held no usable
+    frame. ts is the time of the newest reading; stamps is None when
+    every reading has that time, else the time of each record (binary
+    frames carry their own age). read_at is the monotonic time the block
+    came off the port.
+    """
+    read_at = read_at or time.monotonic()
+    records = parser.parse_block(block)
+    parsed = time.monotonic()
+    latency.record("parse", parsed - read_at)
+    latency.add("blocks")
+    if not records:
+        return None
+    now = time.time()
+    ts = now - parser.age
+    ages = parser.ages
+    mono = parsed
+    active = sensors.active
+    with sensors_lock:
+        if ages is None:
+            stamps = None
+            records = [(tid, value) for tid, value in records if active[tid]]
+            for tid, value in records:
+                apply_reading(tid, value, ts, mono)
+        else:
+            kept = [(tid, value, now - age) for (tid, value), age in zip(records, ages) if active[tid]]
+            records = [(tid, value) for tid, value, _ in kept]
+            stamps = [when for _, _, when in kept]
+            for tid, value, when in kept:
+                apply_reading(tid, value, when, mono)
+        if derived_engine.rules:
+            derived = apply_derived({tid for tid, _ in records}, ts, mono)
+            records += derived
+            if stamps is not None:
+                stamps += [ts] * len(derived)
+        evaluated = time.monotonic()
+        stamp = (read_at, evaluated)
+        for tid, _ in records:
+            unpainted.setdefault(tid, stamp)
+        # Here and not in an engine subscriber, whose queue drops batches
+        # when it falls behind; the Tk and headless timers pick them up
+        if records:
+            mark_dirty(tid for tid, _ in records)
+    latency.record("status", evaluated - parsed)
+    latency.add("readings", len(records))
+    return (ts, records, stamps) if records else None
+
+
+def ingest_block(port, block):
+    """IngestEngine apply(): runs in the engine thread, never touches Tk"""
+    read_at = time.monotonic()
+    if log.isEnabledFor(logging.DEBUG) and port.raw:
+        log.debug("block port=%s raw=%s", port.port, block.hex())
+    elif log.isEnabledFor(logging.DEBUG):
+        for line in block.splitlines():
+            log.debug("frame port=%s raw=%s", port.port, line.hex() if raw_hex else line.decode(errors='replace'))
+    return parse_frames(block, port.parser, read_at)
+
+
+async def history_writer(batch):
+    """Engine subscriber: hand the readings to the persistent history stores"""
+    ts, records, stamps = batch
+    # The sinks belong to the engine thread and tags only ever grows, so
+    # the disk writes stay outside sensors_lock
+    tags = sensors.tags
+    for sink in history_sinks:
+        for (tid, value), when in zip(records, stamps or [ts] * len(records)):
+            sink.append(tags[tid], when, value)
+
+
+async def event_push(batch):
+    """Engine subscriber: publish the new readings to the /events stream"""
+    records = batch[1]
+    with sensors_lock:
+        push_changes({tid for tid, _ in records})
+
+
+def flush_sinks():
+    for sink in history_sinks:
+        sink.flush_if_due()
+
+
+def log_summary(engine, state):
+    """Engine timer: one rate line, one line per port and the sensor table"""
+    now = time.monotonic()
+    frames = sum(port.parser.frames for port in serial_ports)
+    rate = (frames - state['frames']) / max(now - state['time'], 1e-9)
+    state['frames'], state['time'] = frames, now
+    log.info("summary frames=%d rate=%.1f/s active=%d dropped=%s",
+             frames, rate, len(sensors.active_ids()),
+             ",".join("{0}:{1}".format(k, v) for k, v in engine.dropped.items()))
+    for port in serial_ports:
+        c = port.counters()
+        log.info("port port=%s open=%d bytes=%d frames=%d errors=%d opened=%d rejected=%s",
+                 c['port'], c['open'], c['bytes'], c['frames'], c['errors'], c['opened'],
+                 ",".join("{0}:{1}".format(k, v) for k, v in c['rejected'].items()))
+    log.info("latency p50/p99/max_ms %s", latency.summary())
+    with sensors_lock:
+        table = sensor_table()
+    log.info("sensors\n%s", table)
+
+
+def start_ingest(args, timers=()) -> IngestEngine:
+    """Open every --port and start the asyncio ingest thread, timers are extra (seconds, fn)"""
+    for name, baud, framing in zip(args.port, args.baud, args.framing):
+        port = SerialPort(name, baud, raw=framing != "ascii")
+        if framing == "binary":
+            port.parser = BinaryFrameParser(sensors)
+        elif framing == "auto":
+            port.parser = AutoFrameParser(sensors, name)
+        else:
+            port.parser = FrameParser(sensors)
+        serial_ports.append(port)
+    global raw_hex
+    raw_hex = args.hex
+    engine = IngestEngine(serial_ports, ingest_block)
+    if event_hub is not None:
+        engine.subscribe('push', event_push)
+    if history_sinks:
+        engine.subscribe('history', history_writer, maxsize=10000)
+        engine.every(args.timeout, flush_sinks)
+    if profiler is not None:
+        engine.every(0.5, lambda: profiler.poll('ingest'))
+    if args.summary_interval > 0:
+        state = {'frames': 0, 'time': time.monotonic()}
+        engine.every(args.summary_interval, lambda: log_summary(engine, state))
+    for seconds, fn in timers:
+        engine.every(seconds, fn)
+    engine.start()
+    log.info("ingest_start ports=%s", ",".join(map(repr, serial_ports)))
+    return engine
+
+
+def collect_dirty_ids() -> set:
+    """Return the sensors that got a new reading or changed status since the last call"""
+    global table_version
+    changed = set(dirty_ids)
+    dirty_ids.clear()
+    expired = status_engine.expire()
+    if expired:
+        changed.update(expired)
+        table_version += 1
+        push_changes(expired)
+    return changed
+
+
+def refresh_labels(root, labels, painted, interval_ms):
+    """
+    Repaint the rows that changed, from the Tk main loop on a fixed cadence.
+    painted keeps the (text, bg, fg) last given to each label so an
+    unchanged row never reaches Tk. The next pass is pulled in when a
+    sensor goes stale before the cadence would come round.
+    """
+    with sensors_lock:
+        rows = [(tid, unpainted.pop(tid, None)) for tid in collect_dirty_ids()]
+        rows = [(tid, format_sensor(tid), STATUS_COLORS[get_sensor_status(tid)], stamp)
+                for tid, stamp in rows if sensors.active[tid]]
+        deadline = status_engine.next_deadline()
+    configured = 0
+    for i, text, (bg, fg), _ in rows:
+        if painted[i] != (text, bg, fg):
+            labels[i].config(text=text, bg=bg, fg=fg)
+            painted[i] = (text, bg, fg)
+            configured += 1
+    now = time.monotonic()
+    for _, _, _, stamp in rows:
+        if stamp is not None:
+            latency.record("paint", now - stamp[1])
+            latency.record("total", now - stamp[0])
+    latency.add("repaints")
+    latency.add("labels", configured)
+    delay = interval_ms
+    if deadline is not None:
+        delay = max(1, min(delay, int((deadline - time.monotonic()) * 1000) + 1))
+    root.after(delay, refresh_labels, root, labels, painted, interval_ms)
+
+
+def reload_sensors(defs):
+    """Merge re-read definitions into the running tables, the ingest thread keeps going"""
+    with sensors_lock:
+        added, removed, changed = sensors.apply_definitions(defs)
+        while len(status_engine.status) < len(sensors):
+            status_engine.add_sensor()
+            history.add()
+            rollups.add()
+        for tid in removed:
+            status_engine.forget(tid)
+        for tid in changed:
+            status_engine.thresholds_changed(tid)
+        derived_engine.rebuild(sensors)
+        for port in serial_ports:
+            port.parser.rebuild(sensors)
+        mark_dirty(added + removed + changed)
+    if added or removed or changed:
+        log.info("sensors_reload file=%s added=%d removed=%d changed=%d",
+                 SENSOR_FILE, len(added), len(removed), len(changed))
+    return added, removed, changed
+
+
+def sensor_file_mtime(default=None):
     try:
-        # Read loop
-        if True:
-            # readline() returns bytes; decode with errors replaced
-            #line = ser.readline()
-            if line:
-                ts = format_ts()
-                try:
-                    text = line.decode("utf-8", errors="replace").rstrip("\r\n")
-                except Exception:
-                    text = repr(line)
-                if((text[0] == '<') and (text[-1] == '>')):
-                    print(text)
-                    text = text[1:-1]
-                    fields = text.split(';')
-                    print(fields)
-                    if fields[1] in sensors:
-                        if fields[2] == sensors[fields[1]]['Type']:
-                            # sensors[fields[1]]['Temp'] = float(fields[3])
-                            try:
-                                sensors[fields[1]]['Value'] = float(fields[3])
-                                sensors[fields[1]]['Updated'] = datetime.now()
-                            except:
-                                pass
-                            
-                            
-                    print_sensors()
-                    #print (sensors)
-                    #print(text, fields)
-                #print(f"{ts}  {text}")
-    
-    except KeyboardInterrupt:
-        print("\nInterrupted by user, closing serial port...")
-    except SerialException as e:
-        print(f"Serial error: {e}")
-    finally:
-        try:
-            ser.close()
-        except Exception:
-            pass
+        return os.stat(SENSOR_FILE).st_mtime_ns
+    except OSError:
+        return default
 
 
-def update_loop(root, labels):
-    args = parse_args()
-    
-    """Loop that updates labels from outside the window"""
-    counter = 0
+def check_sensor_file(last_mtime):
+    """Reload the sensor file if its mtime moved, return (mtime, added, removed, changed)"""
+    mtime = sensor_file_mtime(last_mtime)
+    if mtime == last_mtime:
+        return mtime, [], [], []
     try:
-        ser = open_serial(args.port, args.baud, args.timeout)
-        print(f"Started serial reader on port={args.port} baud={args.baud} timeout={args.timeout}")
-    except Exception:
-        print('open_serial() failed')
-        return 2
+        defs = load_definitions(SENSOR_FILE)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        # Most likely caught in the middle of a non-atomic save, retry next time
+        log.warning("sensors_reload_failed file=%s error=%r", SENSOR_FILE, e)
+        return last_mtime, [], [], []
+    return (mtime,) + reload_sensors(defs)
+
+
+def watch_sensor_file(root, rows, interval_ms, last_mtime):
+    """Poll the mtime of the sensor file from the Tk main loop, apply edits live"""
+    mtime, added, removed, changed = check_sensor_file(last_mtime)
+    if added or removed:
+        build_rows(root, rows)
+    root.after(interval_ms, watch_sensor_file, root, rows, interval_ms, mtime)
+
+
+def save_definitions():
+    """Write the definitions to the sensor file if an edit asked for it"""
+    with definitions_lock:
+        if not save_requested.is_set():
+            return
+        save_requested.clear()
+        with sensors_lock:
+            defs = sensors.definitions()
+        try:
+            write_definitions(SENSOR_FILE, defs)
+        except (OSError, ValueError) as e:
+            log.error("sensors_save_failed file=%s error=%r", SENSOR_FILE, e)
 
+
+def definitions_writer():
+    """Thread: write threshold edits back to the sensor file, off the Tk thread"""
     while True:
-        line = ser.readline()
-        if line:
-            print(line)
-        parse_line(line)
-        #labels[0].config(text=f"Counter: {counter}")
-        # https://www.plus2net.com/python/tkinter-colors.php
-        for i in range(nbr_of_sensors):
-            sensor_status =  get_sensor_status(msg_tags[i])
-            if sensor_status == SENSOR_STATUS_OK:
-                labels[i].config(text=format_sensor(msg_tags[i]),bg='green',fg='white')
-            elif sensor_status == SENSOR_STATUS_NO_DATA:
-                labels[i].config(text=format_sensor(msg_tags[i]),bg='grey',fg='black')
-            elif sensor_status == SENSOR_STATUS_OUTDATED:
-                labels[i].config(text=format_sensor(msg_tags[i]),bg='chocolate',fg='black')
-            elif sensor_status == SENSOR_STATUS_LOW_TEMPERATURE:
-                labels[i].config(text=format_sensor(msg_tags[i]),bg='cyan',fg='black')
-            elif sensor_status == SENSOR_STATUS_HIGH_TEMPERATURE:
-                labels[i].config(text=format_sensor(msg_tags[i]),bg='crimson',fg='gold1')
-        #labels[0].config(text=format_sensor('VA1'))
-            #labels[1].config(text=f"Double: {counter * 2}")
-        #labels[2].config(text=f"Square: {counter ** 2}")
-        #labels[3].config(text=f"Time: {time.time():.2f}")
-        #counter += 1
-        time.sleep(1)
+        save_requested.wait()
+        save_definitions()
+
 
 
+def publish_snapshot(writer, state):
+    """Headless timer: expire stale sensors, publish what changed into shared memory"""
+    with sensors_lock:
+        writer.publish(sensors, status_engine.status, collect_dirty_ids(),
+                       catalog=state.pop('catalog', False))
+
+
+def watch_sensor_file_headless(state):
+    """Headless timer: apply sensor file edits, republish the catalog when they did anything"""
+    state['mtime'], added, removed, changed = check_sensor_file(state['mtime'])
+    if added or removed or changed:
+        state['catalog'] = True
+
+
+def run_headless(args, http_server=None) -> int:
+    try:
+        writer = SnapshotWriter(args.shm, capacity=args.shm_capacity, interval=args.refresh_ms / 1000.0)
+    except FileExistsError as e:
+        log.error("shm_in_use shm=%s error=%r", args.shm, str(e))
+        if http_server is not None:
+            http_server.stop()
+        return 1
+    if len(sensors) > writer.capacity:
+        log.warning("shm_capacity_exceeded sensors=%d capacity=%d", len(sensors), writer.capacity)
+    state = {'catalog': True, 'mtime': sensor_file_mtime()}
+    engine = start_ingest(args, timers=(
+        (args.refresh_ms / 1000.0, lambda: publish_snapshot(writer, state)),
+        (args.reload_ms / 1000.0, lambda: watch_sensor_file_headless(state)),
+    ))
+    log.info("headless_start shm=%s capacity=%d", args.shm, writer.capacity)
+
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    stop.wait()
+
+    engine.stop()
+    if http_server is not None:
+        http_server.stop()
+    if profiler is not None:
+        profiler.close()
+    for sink in history_sinks:
+        sink.close()
+    writer.close()
+    log.info("headless_stop")
+    return 0
+
+
+def map_catalog(catalog) -> list:
+    """
+    Viewer: register the daemon's sensors in the local table by tag and
+    return the local id of every daemon id. Local sensors the daemon does
+    not have go inactive.
+    """
+    tids = []
+    for tag, location, type_, derived in catalog:
+        tid = sensors.ids.get(tag)
+        if tid is None:
+            tid = sensors.add(tag, location, type_, 0.0, 0.0, derived)
+            status_engine.add_sensor()
+            history.add()
+            rollups.add()
+        sensors.locations[tid] = location
+        sensors.types[tid] = type_
+        sensors.derived[tid] = derived
+        tids.append(tid)
+    known = set(tids)
+    for tid in range(len(sensors)):
+        if tid not in known:
+            sensors.active[tid] = 0
+    return tids
+
+
+def mark_snapshot_stale():
+    """Viewer: the daemon stopped publishing, show every row with a reading OUTDATED"""
+    status = status_engine.status
+    changed = [tid for tid in sensors.active_ids()
+               if status[tid] not in (SENSOR_STATUS_NO_DATA, SENSOR_STATUS_OUTDATED)]
+    for tid in changed:
+        status[tid] = SENSOR_STATUS_OUTDATED
+    if changed:
+        mark_dirty(changed)
+        push_changes(changed)
+
+
+def follow_snapshot(root, rows, reader, state, interval_ms):
+    """
+    Viewer: copy the daemon's latest snapshot into the local table from
+    the Tk main loop. When the daemon stops publishing the rows go
+    OUTDATED, and a segment created by a restarted daemon is picked up.
+    The local history and rollups only get the latest reading of each
+    sensor per poll, so the viewer's trends and minute buckets are
+    sampled at the poll interval and can miss short extremes.
+    """
+    if reader.stale():
+        if not state['stale']:
+            state['stale'] = True
+            log.warning("snapshot_stale shm=%s pid=%d idle_s=%.1f", reader.name, reader.pid, reader.idle())
+            with sensors_lock:
+                mark_snapshot_stale()
+        new = reader.replacement()
+        if new is not None:
+            log.info("snapshot_reopen shm=%s pid=%d", new.name, new.pid)
+            reader.close()
+            reader = new
+            state['seq'] = state['generation'] = None
+    snap = reader.read(state['seq'])
+    relayout = False
+    changed = []
+    if snap is not None:
+        if state['stale']:
+            state['stale'] = False
+            log.info("snapshot_resumed shm=%s pid=%d", reader.name, reader.pid)
+        state['seq'] = snap.seq
+        with sensors_lock:
+            if snap.generation != state['generation']:
+                state['generation'] = snap.generation
+                state['tids'] = map_catalog(snap.catalog)
+                relayout = True
+            tids = state['tids']
+            for i, (value, min_value, max_value, updated, status, active) in enumerate(snap.records):
+                tid = tids[i]
+                if updated != sensors.updated[tid] and updated:
+                    history.append(tid, updated, value)
+                    rollups.update(tid, updated, value)
+                if (sensors.values[tid], sensors.mins[tid], sensors.maxs[tid], sensors.updated[tid],
+                        status_engine.status[tid], sensors.active[tid]) != \
+                        (value, min_value, max_value, updated, status, active):
+                    relayout = relayout or sensors.active[tid] != active
+                    sensors.values[tid] = value
+                    sensors.mins[tid] = min_value
+                    sensors.maxs[tid] = max_value
+                    sensors.updated[tid] = updated
+                    status_engine.status[tid] = status
+                    sensors.active[tid] = active
+                    changed.append(tid)
+            if changed:
+                mark_dirty(changed)
+                push_changes(changed)
+    if relayout:
+        build_rows(root, rows)
+    root.after(interval_ms, follow_snapshot, root, rows, reader, state, interval_ms)
+
 
 DIM_WIDTH = 800
 DIM_HEIGHT = 600
@@ -260,35 +845,102 @@ DIM_BTN_X0     = DIM_ROW_WIDTH +10
 DIM_BTN_WIDTH  = DIM_WIDTH - DIM_ROW_WIDTH -20
 
 
+def poll_profiler(root):
+    """Tk timer: profile the main loop, dump its profile when SIGUSR1 asked for one"""
+    profiler.poll('tk')
+    root.after(500, poll_profiler, root)
+
+
 def cb_verify(tag):
     print(tag)
 
+def build_rows(root, rows):
+    """Create the widgets of sensors that have none yet, lay out the active ones"""
+    labels, buttons, painted = rows
+    for tid in range(len(labels), len(sensors)):
+        label = tk.Label(root, text="Updating...", font=("Arial", 12))
+        labels.append(label)
+        # btn = tk.Button(root,text='OK', command=lambda tag = sensors.tags[tid]: cb_verify(tag))
+        btn = tk.Button(root,text='OK', command=lambda tid = tid: open_config_window(root,tid))
+        buttons.append(btn)
+        painted.append(None)
+    row = 0
+    for tid in range(len(sensors)):
+        if sensors.active[tid]:
+            labels[tid].place(x=0, y=row*DIM_ROW_HEIGHT, width=DIM_ROW_WIDTH, height=DIM_ROW_HEIGHT)
+            buttons[tid].place(x=DIM_BTN_X0, y=row*DIM_ROW_HEIGHT, width=DIM_BTN_WIDTH, height=DIM_ROW_HEIGHT)
+            row += 1
+        else:
+            labels[tid].place_forget()
+            buttons[tid].place_forget()
+
+
 def main() -> int:
-    #read_messages(ser)
+    global history, profiler
+    args = parse_args()
+    setup_logging(args)
+    reader = None
+    if args.attach and not args.headless:
+        # Before anything is started or a window is up
+        try:
+            reader = SnapshotReader(args.shm)
+        except FileNotFoundError:
+            log.error("snapshot_missing shm=%s, is the daemon running with --headless?", args.shm)
+            return 1
+    if args.profile:
+        profiler = Profiler(args.profile, args.profile_interval)
+        profiler.start()
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.request_dump())
+    log.info("sensors_load file=%s count=%d", SENSOR_FILE, len(sensors))
+    history = SensorHistory(len(sensors), args.history_size)
+    if args.history_dir:
+        history_sinks.append(HistoryLog(args.history_dir))
+    if args.history_db:
+        history_sinks.append(SqliteHistory(args.history_db, retention_days=args.retention_days))
+    http_server = start_http(args) if args.http else None
+    if args.headless:
+        return run_headless(args, http_server)
 
     root = tk.Tk()
     root.title("Villa Astrid Control Room")
     geom = "{0}x{1}".format(DIM_WIDTH,DIM_HEIGHT)
     root.geometry(geom)
 
-    labels = []
-    buttons = []
-    for i in range(nbr_of_sensors):
-        label = tk.Label(root, text="Updating...", font=("Arial", 12))
-        # label.pack(anchor=tk.W, pady=5, width=200)
-        label.place(x=0, y=i*DIM_ROW_HEIGHT, width=DIM_ROW_WIDTH, height=DIM_ROW_HEIGHT)
-        labels.append(label)
-        # btn = tk.Button(root,text='OK', command=lambda tag = msg_tags[i]: cb_verify(tag))
-        btn = tk.Button(root,text='OK', command=lambda tag = msg_tags[i]: open_config_window(root,tag))
-        btn.place(x=DIM_BTN_X0, y=i*DIM_ROW_HEIGHT, width=DIM_BTN_WIDTH, height=DIM_ROW_HEIGHT)
-        buttons.append(btn)
+    rows = ([], [], [])
+    build_rows(root, rows)
 
-    # Start update loop in a separate thread
-    thread = Thread(target=update_loop, args=(root, labels), daemon=True)
-    thread.start()
+    menubar = tk.Menu(root)
+    describe = lambda: "repaint every {0} ms, {1} port(s)".format(args.refresh_ms, len(serial_ports))
+    menubar.add_command(label="Diagnostics", command=lambda: DiagnosticsWindow(root, latency, describe))
+    root.config(menu=menubar)
+
+    engine = None
+    if args.attach:
+        # A viewer: the daemon reads the ports and owns the sensor file,
+        # threshold edits saved here reach it through its file watch
+        state = {'seq': None, 'generation': None, 'tids': [], 'stale': False}
+        follow_snapshot(root, rows, reader, state, args.refresh_ms)
+    else:
+        # Serial ingestion runs on an asyncio loop in its own thread, the rows
+        # are repainted by Tk
+        engine = start_ingest(args)
+        root.after(args.reload_ms, watch_sensor_file, root, rows, args.reload_ms, sensor_file_mtime())
+    Thread(target=definitions_writer, daemon=True).start()
+    refresh_labels(root, rows[0], rows[2], args.refresh_ms)
+    if profiler is not None:
+        poll_profiler(root)
 
     root.mainloop()
 
+    if engine is not None:
+        engine.stop()
+    if http_server is not None:
+        http_server.stop()
+    if profiler is not None:
+        profiler.close()
+    save_definitions()
+    for sink in history_sinks:
+        sink.close()
     return 0
 
 
@@ -0,0 +1,223 @@
+"""
+Compact binary sensor frames, an alternative to the ASCII lines.
+
+A frame is 12 bytes, little-endian:
+
+    sync   u8   0xA5
+    tag    u16  tag_id() of the sensor tag
+    type   u8   TYPE_CODES of the sensor type, 0 = not checked
+    value  f32
+    age    u16  milliseconds since the node took the reading, saturating
+    crc    u16  CRC-16/CCITT-FALSE (binascii.crc_hqx, init 0xFFFF) of
+                tag, type, value and age
+
+An ASCII frame such as <RFM;VA1_T;Temp;21.5>\\r\\n is about twice as long,
+and longer node names or values widen the gap. The tag id is a CRC-16
+of the tag string, so a node and the control room only have to agree on
+the tag names, as with ASCII frames. Two active tags with the same id
+are reported and the later one is left out of the table.
+
+BinaryFrameParser is a streaming decoder: parse_block() takes whatever
+bytes the port delivered and keeps a partial frame for the next call.
+While in step, a sync byte whose frame fails the CRC counts as one frame
+in rejected['crc'] and the decoder drops out of step. Every loss of step
+(a bad CRC or a byte that is not a sync byte where a frame should start)
+counts once in rejected['resync']. Until the next good frame the search
+moves on a byte at a time, and every byte it passes, stray 0xA5 bytes
+included, counts in skipped but not as a frame or a CRC failure.
+
+Every reading keeps the age its node sent: parser.ages lists them
+(seconds) in the order of the returned records, parser.age is the
+newest. Values are the float32 widened to a Python float, 21.4 arrives
+as 21.399999618530273; the dashboard formats them to one decimal.
+
+AutoFrameParser looks at the first bytes a port sends and settles on
+ASCII or binary framing for it. ASCII text never contains 0xA5, and a
+run of binary frames practically never matches the ASCII frame pattern.
+"""
+
+from __future__ import annotations
+
+import binascii
+import logging
+import math
+import struct
+
+from frame_parser import FRAME_RE, FrameParser
+
+log = logging.getLogger(__name__)
+
+SYNC = 0xA5
+FRAME = struct.Struct('<BHBfHH')
+FRAME_SIZE = FRAME.size
+CRC_INIT = 0xFFFF
+REJECT_REASONS = ('crc', 'resync', 'tag', 'type', 'value')
+
+TYPE_CODES = {'Temp': 1, 'Hum': 2}
+
+# AutoFrameParser decides after this many frames of one kind
+DETECT_FRAMES = 2
+DETECT_LIMIT = 4096
+
+
+def tag_id(tag: str) -> int:
+    return binascii.crc_hqx(tag.encode('ascii'), 0)
+
+
+def encode_frame(tag: str, type_: str, value: float, age_ms: int = 0) -> bytes:
+    body = FRAME.pack(SYNC, tag_id(tag), TYPE_CODES.get(type_, 0), value, min(age_ms, 0xFFFF), 0)
+    return body[:-2] + struct.pack('<H', binascii.crc_hqx(body[1:-2], CRC_INIT))
+
+
+def count_frames(buf) -> int:
+    """Number of frames with a valid CRC in buf, whatever their tag"""
+    n = 0
+    i = buf.find(SYNC)
+    while 0 <= i <= len(buf) - FRAME_SIZE:
+        if binascii.crc_hqx(buf[i + 1:i + FRAME_SIZE - 2], CRC_INIT) == FRAME.unpack_from(buf, i)[5]:
+            n += 1
+            i += FRAME_SIZE
+        else:
+            i += 1
+        i = buf.find(SYNC, i)
+    return n
+
+
+def build_id_table(sensors) -> dict:
+    """Map the wire tag id to (id, type code) of an active serial sensor"""
+    table = {}
+    for tid in sensors.active_ids():
+        if sensors.derived[tid] is not None:
+            continue
+        key = tag_id(sensors.tags[tid])
+        if key in table:
+            log.warning("binary_tag_collision tag=%s other=%s id=%d",
+                        sensors.tags[tid], sensors.tags[table[key][0]], key)
+            continue
+        table[key] = (tid, TYPE_CODES.get(sensors.types[tid], 0))
+    return table
+
+
+class BinaryFrameParser:
+    def __init__(self, sensors):
+        self.buf = bytearray()
+        self.frames = 0
+        self.skipped = 0
+        self.synced = True
+        self.age = 0.0
+        self.ages = []
+        self.rejected = dict.fromkeys(REJECT_REASONS, 0)
+        self.rebuild(sensors)
+
+    def rebuild(self, sensors):
+        self.id_table = build_id_table(sensors)
+
+    def parse_block(self, data) -> list:
+        """Decode the complete frames in buf + data, return their (id, value) records"""
+        buf = self.buf
+        buf += data
+        end = len(buf)
+        unpack = FRAME.unpack_from
+        crc = binascii.crc_hqx
+        get = self.id_table.get
+        rejected = self.rejected
+        records = []
+        ages = []
+        i = 0
+        while end - i >= FRAME_SIZE:
+            if buf[i] != SYNC:
+                j = buf.find(SYNC, i + 1)
+                if j < 0:
+                    j = end
+                if self.synced:
+                    self.synced = False
+                    rejected['resync'] += 1
+                self.skipped += j - i
+                i = j
+                continue
+            _, key, type_, value, frame_age, check = unpack(buf, i)
+            if crc(buf[i + 1:i + FRAME_SIZE - 2], CRC_INIT) != check:
+                if self.synced:
+                    # A damaged frame where one was due
+                    self.synced = False
+                    self.frames += 1
+                    rejected['crc'] += 1
+                    rejected['resync'] += 1
+                self.skipped += 1
+                i += 1
+                continue
+            i += FRAME_SIZE
+            self.frames += 1
+            self.synced = True
+            entry = get(key)
+            if entry is None:
+                rejected['tag'] += 1
+            elif type_ and entry[1] and type_ != entry[1]:
+                rejected['type'] += 1
+            elif not math.isfinite(value):
+                rejected['value'] += 1
+            else:
+                records.append((entry[0], value))
+                ages.append(frame_age * 0.001)
+        del buf[:i]
+        self.ages = ages
+        self.age = min(ages) if ages else 0.0
+        return records
+
+
+class AutoFrameParser:
+    def __init__(self, sensors, name: str = ''):
+        self.name = name
+        self.ascii = FrameParser(sensors)
+        self.binary = BinaryFrameParser(sensors)
+        self.mode = None
+        self.parser = self.ascii
+        self.lines = bytearray()
+        self.parse_block = self._detect
+
+    @property
+    def frames(self) -> int:
+        return self.parser.frames
+
+    @property
+    def rejected(self) -> dict:
+        return self.parser.rejected
+
+    @property
+    def age(self) -> float:
+        return self.parser.age
+
+    @property
+    def ages(self):
+        return self.parser.ages
+
+    def rebuild(self, sensors):
+        self.ascii.rebuild(sensors)
+        self.binary.rebuild(sensors)
+
+    def _detect(self, data) -> list:
+        buf = self.lines
+        buf += data
+        if count_frames(buf) >= DETECT_FRAMES:
+            self.mode, self.parser, self.parse_block = 'binary', self.binary, self.binary.parse_block
+        elif len(FRAME_RE.findall(buf[:buf.rfind(b'\n') + 1])) >= DETECT_FRAMES:
+            self.mode, self.parser, self.parse_block = 'ascii', self.ascii, self._ascii_lines
+        else:
+            if len(buf) > DETECT_LIMIT:
+                del buf[:-DETECT_LIMIT]
+            return []
+        log.info("framing_detect port=%s mode=%s", self.name, self.mode)
+        data = bytes(buf)
+        buf.clear()
+        return self.parse_block(data)
+
+    def _ascii_lines(self, data) -> list:
+        """Split the raw bytes into complete lines, as SerialPort does for ASCII ports"""
+        buf = self.lines
+        buf += data
+        end = buf.rfind(b'\n')
+        if end < 0:
+            return []
+        block = bytes(buf[:end + 1])
+        del buf[:end + 1]
+        return self.ascii.parse_block(block)
@@ -0,0 +1,214 @@
+"""
+Derived sensors computed from other sensors.
+
+A derived sensor is an ordinary entry in sensor_dict.json with an extra
+"Derived" key naming a function and its input tags:
+
+    "MH1_DP": {"Sensor": "MH1", "Type": "Dew", "Min": 0.0, "Max": 16.0,
+               "Derived": {"Function": "dewpoint", "Inputs": ["VA1_T", "VA1_H"]}}
+
+It gets a registry id, Min/Max thresholds, status, history and a row like
+any sensor, only its readings come from DerivedEngine instead of the
+serial port.
+
+Functions:
+    dewpoint  Inputs [temperature C, relative humidity %], Magnus formula
+    diff      Inputs [a, b], a - b (indoor - outdoor and the like)
+    rate      Inputs [x], change of x per hour over "Window" seconds
+              (default 600)
+
+The engine keeps an id-indexed list of the rules that read each sensor.
+evaluate() is given the ids that just got a reading and only looks at the
+rules hanging off them, so its cost follows the number of changed inputs,
+not the number of rules. A derived sensor may itself be an input: the
+rules reached are run in dependency order (each rule's level is one more
+than that of its deepest derived input) and each at most once per call,
+which also stops cycles. A result is stored with its timestamp before
+the next rule runs, so a rule reading it sees the new value.
+
+A rule whose function fails on its inputs (a dewpoint at 0 % RH, a
+division by zero) does not stop the others. Its sensor's value is
+invalidated, its id is listed in failed for the caller to flag, and the
+failure is logged once until the rule computes again.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from operator import attrgetter
+
+log = logging.getLogger(__name__)
+
+RATE_WINDOW = 600.0
+
+
+def dewpoint(temp: float, rh: float):
+    if rh <= 0.0:
+        raise ValueError("dewpoint needs a relative humidity above 0, got {0}".format(rh))
+    a, b = 17.62, 243.12
+    g = math.log(min(rh, 100.0) / 100.0) + a * temp / (b + temp)
+    return b * g / (a - g)
+
+
+def diff(a: float, b: float):
+    return a - b
+
+
+# name -> (number of inputs, function of the input values), None = stateful
+FUNCTIONS = {
+    'dewpoint': (2, dewpoint),
+    'diff': (2, diff),
+    'rate': (1, None),
+}
+
+
+class Rule:
+    __slots__ = ('out', 'function', 'inputs', 'window', 'spec', 'anchors', 'level', 'failing')
+
+    def __init__(self, out: int, function: str, inputs: tuple, window: float, spec: dict):
+        self.out = out
+        self.function = function
+        self.inputs = inputs
+        self.window = window
+        self.spec = spec
+        self.anchors = []       # rate: up to two (ts, value), oldest first
+        self.level = 1          # 1 + the level of its deepest derived input
+        self.failing = False
+
+    def rate(self, ts: float, value: float):
+        """Change per hour against an anchor between window and 2 * window old"""
+        anchors = self.anchors
+        if not anchors or ts - anchors[-1][0] >= self.window:
+            anchors.append((ts, value))
+            if len(anchors) > 2:
+                del anchors[0]
+        t0, v0 = anchors[0]
+        if ts - t0 < self.window:
+            return None
+        return (value - v0) * 3600.0 / (ts - t0)
+
+
+class DerivedEngine:
+    def __init__(self, sensors):
+        self.sensors = sensors
+        self.rules = {}             # output id -> Rule
+        self.dependents = []        # input id -> tuple of the Rules reading it
+        self.failed = []            # output ids whose rule failed in the last evaluate()
+        self.rebuild(sensors)
+
+    def rebuild(self, sensors):
+        """
+        Recompile the rules after the registry changed. A rule whose
+        definition is unchanged keeps its rate anchors.
+        """
+        rules = {}
+        for tid in sensors.active_ids():
+            spec = sensors.derived[tid]
+            if spec is None:
+                continue
+            # The definitions file is hand edited, a malformed entry is
+            # skipped rather than taking the other rules down with it
+            try:
+                function = spec.get('Function')
+                inputs = spec.get('Inputs', [])
+                window = float(spec.get('Window', RATE_WINDOW))
+                if not isinstance(inputs, (list, tuple)):
+                    raise TypeError("Inputs must be a list")
+                if function not in FUNCTIONS or len(inputs) != FUNCTIONS[function][0]:
+                    raise ValueError("wrong function or number of inputs")
+                if not window > 0:
+                    raise ValueError("window must be positive")
+                missing = [tag for tag in inputs if tag not in sensors.ids]
+            except (TypeError, ValueError, AttributeError) as e:
+                log.warning("derived_invalid tag=%s spec=%r error=%r", sensors.tags[tid], spec, str(e))
+                continue
+            if missing:
+                log.warning("derived_missing_input tag=%s inputs=%s", sensors.tags[tid], missing)
+                continue
+            old = self.rules.get(tid)
+            if old is not None and old.spec == spec:
+                rules[tid] = old
+                continue
+            rules[tid] = Rule(tid, function, tuple(sensors.ids[tag] for tag in inputs),
+                              window, spec)
+        dependents = [[] for _ in range(len(sensors))]
+        for rule in rules.values():
+            for tid in set(rule.inputs):
+                dependents[tid].append(rule)
+        levels = {}
+        for tid in rules:
+            self._level(rules, levels, tid, set())
+        for tid, rule in rules.items():
+            rule.level = levels[tid]
+        self.rules = rules
+        self.dependents = [tuple(rules) for rules in dependents]
+
+    def _level(self, rules: dict, levels: dict, tid: int, path: set) -> int:
+        """0 for a serial sensor, else 1 + the deepest input; an input on a cycle counts as 0"""
+        if tid in levels:
+            return levels[tid]
+        rule = rules.get(tid)
+        if rule is None or tid in path:
+            return 0
+        path.add(tid)
+        level = 1 + max(self._level(rules, levels, i, path) for i in rule.inputs)
+        path.discard(tid)
+        levels[tid] = level
+        return level
+
+    def _compute(self, rule: Rule):
+        sensors = self.sensors
+        for tid in rule.inputs:
+            if not sensors.active[tid] or not sensors.updated[tid]:
+                return None
+        if rule.function == 'rate':
+            tid = rule.inputs[0]
+            return rule.rate(sensors.updated[tid], sensors.values[tid])
+        return FUNCTIONS[rule.function][1](*[sensors.values[tid] for tid in rule.inputs])
+
+    def evaluate(self, changed, ts: float) -> list:
+        """
+        Recompute the rules reading any of the changed ids, directly or
+        through other derived sensors, and return the new [(id, value)] of
+        the derived sensors, stamped ts. The caller applies them and flags
+        the ids in failed.
+        """
+        dependents = self.dependents
+        sensors = self.sensors
+        self.failed = []
+        reached = {}
+        pending = list(changed)
+        while pending:
+            tid = pending.pop()
+            if tid >= len(dependents):
+                continue
+            for rule in dependents[tid]:
+                if rule.out not in reached:
+                    reached[rule.out] = rule
+                    pending.append(rule.out)
+        rules = reached.values()
+        if len(reached) > 1:
+            rules = sorted(rules, key=attrgetter('level'))
+        results = []
+        for rule in rules:
+            try:
+                value = self._compute(rule)
+            except (ArithmeticError, ValueError) as e:
+                # No value rather than a stale one, for the row and the rules reading it
+                sensors.updated[rule.out] = 0.0
+                self.failed.append(rule.out)
+                if not rule.failing:
+                    rule.failing = True
+                    log.warning("derived_failed tag=%s function=%s error=%r",
+                                sensors.tags[rule.out], rule.function, str(e))
+                continue
+            if value is not None:
+                if rule.failing:
+                    rule.failing = False
+                    log.info("derived_recovered tag=%s", sensors.tags[rule.out])
+                # The rules after this one see the new value
+                sensors.values[rule.out] = value
+                sensors.updated[rule.out] = ts
+                results.append((rule.out, value))
+        return results
@@ -0,0 +1,106 @@
+"""
+Diagnostics window: pipeline latency and throughput.
+
+Shows one row per LatencyStats stage (count, mean, p50, p90, p99, max in
+milliseconds) and the counters with their rate over the last poll and
+since the last reset. Refreshed once a second while open; Export writes
+LatencyStats.snapshot() as JSON, Reset starts the histograms over.
+"""
+
+from __future__ import annotations
+
+import time
+import tkinter as tk
+from tkinter import filedialog
+
+POLL_MS = 1000
+STAGE_COLUMNS = ('Stage', 'Count', 'Mean', 'p50', 'p90', 'p99', 'Max')
+COUNTER_COLUMNS = ('Counter', 'Total', 'Now /s', 'Avg /s')
+
+
+class DiagnosticsWindow:
+    def __init__(self, root, stats, describe=None):
+        """stats is a LatencyStats, describe() an optional one-line note shown on top"""
+        self.stats = stats
+        self.describe = describe
+
+        self.win = tk.Toplevel(root)
+        self.win.title("Diagnostics")
+        self.note = tk.Label(self.win, anchor='w', font=('Arial', 10))
+        self.note.grid(row=0, column=0, columnspan=len(STAGE_COLUMNS), sticky='we', padx=5, pady=5)
+
+        row = 1
+        for col, name in enumerate(STAGE_COLUMNS):
+            tk.Label(self.win, text=name, font=('Arial', 10, 'bold')).grid(row=row, column=col, padx=5, sticky='e')
+        self.stage_cells = {}
+        for name in stats.stage_names:
+            row += 1
+            self.stage_cells[name] = self._row(row, name, len(STAGE_COLUMNS))
+
+        row += 1
+        for col, name in enumerate(COUNTER_COLUMNS):
+            tk.Label(self.win, text=name, font=('Arial', 10, 'bold')).grid(row=row, column=col, padx=5, pady=(10, 0),
+                                                                          sticky='e')
+        self.counter_cells = {}
+        for name in stats.counter_names:
+            row += 1
+            self.counter_cells[name] = self._row(row, name, len(COUNTER_COLUMNS))
+
+        row += 1
+        tk.Button(self.win, text='Export JSON', command=self.export).grid(row=row, column=0, pady=10, padx=5)
+        tk.Button(self.win, text='Reset', command=self.reset).grid(row=row, column=1, pady=10, padx=5)
+        tk.Button(self.win, text='Close', command=self.close).grid(row=row, column=len(STAGE_COLUMNS) - 1,
+                                                                   pady=10, padx=5)
+
+        self.last = (time.monotonic(), dict(stats.counters))
+        self._poll_id = None
+        self.win.protocol("WM_DELETE_WINDOW", self.close)
+        self.poll()
+
+    def _row(self, row: int, name: str, columns: int) -> list:
+        tk.Label(self.win, text=name, anchor='w').grid(row=row, column=0, padx=5, sticky='w')
+        cells = [tk.Label(self.win, anchor='e', width=9) for _ in range(columns - 1)]
+        for col, cell in enumerate(cells, 1):
+            cell.grid(row=row, column=col, padx=5, sticky='e')
+        return cells
+
+    def poll(self):
+        snap = self.stats.snapshot()
+        for name, cells in self.stage_cells.items():
+            s = snap['stages'][name]
+            texts = [str(s['count'])] + ["{0:.2f}".format(s[k] / 1000)
+                                         for k in ('mean_us', 'p50_us', 'p90_us', 'p99_us', 'max_us')]
+            for cell, text in zip(cells, texts):
+                cell.config(text=text)
+        now = time.monotonic()
+        last_time, last_counters = self.last
+        elapsed = max(now - last_time, 1e-9)
+        for name, cells in self.counter_cells.items():
+            total = snap['counters'][name]
+            current = max(0, total - last_counters.get(name, 0)) / elapsed
+            for cell, text in zip(cells, (str(total), "{0:.1f}".format(current),
+                                          "{0:.1f}".format(snap['rates'][name]))):
+                cell.config(text=text)
+        self.last = (now, snap['counters'])
+        note = "Times in ms since {0}".format(time.strftime("%H:%M:%S", time.localtime(snap['since'])))
+        if self.describe is not None:
+            note += ", " + self.describe()
+        self.note.config(text=note)
+        self._poll_id = self.win.after(POLL_MS, self.poll)
+
+    def export(self):
+        path = filedialog.asksaveasfilename(parent=self.win, defaultextension='.json',
+                                            initialfile=time.strftime("latency-%Y%m%d-%H%M%S.json"),
+                                            filetypes=[('JSON', '*.json')])
+        if path:
+            with open(path, 'w') as f:
+                f.write(self.stats.to_json())
+
+    def reset(self):
+        self.stats.reset()
+        self.last = (time.monotonic(), {})
+
+    def close(self):
+        if self._poll_id is not None:
+            self.win.after_cancel(self._poll_id)
+        self.win.destroy()
@@ -0,0 +1,88 @@
+"""
+Change events for the server-sent-events stream (GET /events).
+
+The application publishes one event per change set: a dict of
+{tag: {field: value}} holding only what changed, new readings
+(value, updated, status) or status transitions (status). Every event
+gets the next id and goes into a fixed-size replay buffer.
+
+A subscriber keeps the id of the last event it sent. since() hands it
+everything newer, and the handler coalesces that into one message, the
+latest fields per tag, so a client that is a few events behind gets one
+write instead of many. When the client is further behind than the
+replay buffer reaches, or reconnects with an id the buffer no longer
+has (Last-Event-ID from a previous run, say), since() says so and the
+client is sent a full snapshot instead.
+
+publish() only appends under a short lock and notifies the waiting
+subscriber threads; it never waits for a socket. A client that stops
+reading blocks only its own handler thread until the write timeout
+drops it.
+
+Ids start from the startup time in milliseconds, so an id from an
+earlier run is always older than the buffer and leads to a snapshot.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+DEFAULT_REPLAY = 1000
+
+
+def merge_events(events) -> dict:
+    """Coalesce [(id, changes)] into one changes dict, later fields win"""
+    merged = {}
+    for _, changes in events:
+        for tag, fields in changes.items():
+            if tag in merged:
+                merged[tag].update(fields)
+            else:
+                merged[tag] = dict(fields)
+    return merged
+
+
+class EventHub:
+    def __init__(self, replay: int = DEFAULT_REPLAY):
+        self.events = deque(maxlen=replay)
+        self.cond = threading.Condition()
+        self.last_id = int(time.time() * 1000)
+        self.closed = False
+        self.published = 0
+        self.subscribers = 0
+        self.snapshots = 0
+        self.dropped = 0
+
+    def publish(self, changes: dict):
+        if not changes:
+            return
+        with self.cond:
+            self.last_id += 1
+            self.events.append((self.last_id, changes))
+            self.published += 1
+            self.cond.notify_all()
+
+    def since(self, cursor: int, timeout: float):
+        """
+        Wait up to timeout for events newer than cursor. Return
+        (id, events): events is [] on timeout, None when cursor is no
+        longer covered by the replay buffer and a snapshot is needed.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.last_id != cursor or self.closed, timeout):
+                return cursor, []
+            if self.closed:
+                return cursor, []
+            oldest = self.events[0][0] if self.events else self.last_id + 1
+            if cursor < oldest - 1 or cursor > self.last_id:
+                return self.last_id, None
+            events = list(islice(self.events, cursor - oldest + 1, None))
+            return self.last_id, events
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
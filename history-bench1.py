@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the history backends.
+
+Writes --days of synthetic readings for --sensors sensors, one reading per
+sensor every --interval seconds, into a fresh binary log directory or
+SQLite database, then reads them back: the whole range (log only), the
+whole range of one tag and the last hour of one tag.
+
+Usage:
+  python3 history-bench1.py --dir /tmp/va-history --days 30 --interval 10
+  python3 history-bench1.py --backend sqlite --dir /tmp/va-history.db
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import time
+
+from history_log import HistoryLog, HistoryReader
+from history_sqlite import SqliteHistory
+
+
+def disk_usage(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return sum(os.path.getsize(path + ext) for ext in ('', '-wal', '-shm') if os.path.exists(path + ext))
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="History backend benchmark")
+    p.add_argument("--backend", choices=("log", "sqlite"), default="log")
+    p.add_argument("--dir", default="/tmp/va-history-bench")
+    p.add_argument("--sensors", type=int, default=9)
+    p.add_argument("--days", type=float, default=30.0)
+    p.add_argument("--interval", type=float, default=10.0)
+    args = p.parse_args()
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    for ext in ('', '-wal', '-shm'):
+        if os.path.isfile(args.dir + ext):
+            os.unlink(args.dir + ext)
+    tags = ["S{0:03d}_T".format(i) for i in range(args.sensors)]
+    t_begin = time.time() - args.days * 86400
+    steps = int(args.days * 86400 / args.interval)
+    total = steps * len(tags)
+
+    if args.backend == 'log':
+        log = HistoryLog(args.dir)
+    else:
+        log = SqliteHistory(args.dir)
+    t0 = time.perf_counter()
+    for step in range(steps):
+        ts = t_begin + step * args.interval
+        for tag in tags:
+            log.append(tag, ts, 20.0)
+    log.close()
+    dt = time.perf_counter() - t0
+    size = disk_usage(args.dir)
+    print("insert      {0:10d} records  {1:6.1f} s  {2:10.0f} records/s  {3:.0f} MB on disk".format(
+          total, dt, total / dt, size / 1e6))
+
+    if args.backend == 'log':
+        reader = HistoryReader(args.dir)
+        t0 = time.perf_counter()
+        n = sum(1 for _ in reader.scan(t_begin, time.time()))
+        dt = time.perf_counter() - t0
+        print("scan all    {0:10d} records  {1:6.1f} s  {2:10.0f} records/s".format(n, dt, n / dt))
+    else:
+        reader = log
+
+    t0 = time.perf_counter()
+    times, values = reader.query(tags[0], t_begin, time.time())
+    dt = time.perf_counter() - t0
+    print("query 1 tag {0:10d} records  {1:6.1f} s".format(len(times), dt))
+
+    t0 = time.perf_counter()
+    times, values = reader.query(tags[0], time.time() - 3600, time.time())
+    dt = time.perf_counter() - t0
+    print("last hour   {0:10d} records  {1:9.4f} s".format(len(times), dt))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
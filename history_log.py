@@ -0,0 +1,251 @@
+"""
+Append-only binary history log.
+
+Every reading is one fixed-size little-endian record:
+
+    timestamp  float64  epoch seconds
+    tag id     uint32   index into <dir>/tags.json
+    value      float32
+
+Records are appended to segment files <dir>/seg-<start ms>.bin. A new
+segment is started when the current one reaches segment_bytes or is older
+than segment_seconds, so old data can be removed or archived a file at a
+time. Appends collect in memory and reach the SD card in one write per
+flush_bytes or flush_seconds, whichever comes first. A flush that fails
+(full or read-only card) keeps the records that did not make it and is
+retried flush_seconds later; the file is cut back to the last whole
+record, and past max_buffer bytes the oldest records are dropped and
+counted in dropped.
+
+HistoryReader mmaps the segments that overlap a time range and binary
+searches the timestamps, nothing is parsed as text. Readings are written
+by one thread in arrival order, but a binary frame is stamped with the
+time its node took it (up to 65.5 s before arrival), so timestamps are
+only ordered to within MAX_DISORDER seconds: a record is never older
+than one written before it by more than that. The search is widened by
+MAX_DISORDER on both sides and every record is checked against the
+range. If the wall clock is stepped backwards by more than MAX_DISORDER
+the search may miss the samples written around the step.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+
+log = logging.getLogger(__name__)
+
+RECORD = struct.Struct('<dIf')
+TIMESTAMP = struct.Struct('<d')
+TAGS_FILE = 'tags.json'
+MAX_DISORDER = 70.0     # seconds, above the largest binary frame age (0xFFFF ms)
+
+
+def segment_name(ts: float) -> str:
+    return "seg-{0:013d}.bin".format(int(ts * 1000))
+
+
+def list_segments(directory: str) -> list:
+    """Return [(start_ts, path)] of the segments in directory, oldest first"""
+    segments = []
+    for name in os.listdir(directory):
+        if name.startswith('seg-') and name.endswith('.bin'):
+            try:
+                start = int(name[4:-4]) / 1000.0
+            except ValueError:
+                continue
+            segments.append((start, os.path.join(directory, name)))
+    segments.sort()
+    return segments
+
+
+def load_tag_ids(directory: str) -> list:
+    try:
+        with open(os.path.join(directory, TAGS_FILE)) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return []
+
+
+class HistoryLog:
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024,
+                 segment_seconds: float = 86400.0, flush_bytes: int = 64 * 1024,
+                 flush_seconds: float = 10.0, max_buffer: int = 16 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.flush_bytes = flush_bytes
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        os.makedirs(directory, exist_ok=True)
+
+        self.tags = load_tag_ids(directory)
+        self.tag_ids = {tag: i for i, tag in enumerate(self.tags)}
+        self.buf = bytearray()
+        self.last_flush = time.monotonic()
+        self.retry_at = 0.0         # monotonic, no flush before it after a failure
+        self.records = 0
+        self.dropped = 0
+
+        self.fp = None
+        self.segment_start = 0.0
+        self.segment_size = 0
+        segments = list_segments(directory)
+        if segments:
+            self._open_segment(*segments[-1])
+
+    def _open_segment(self, start: float, path: str):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+        fp = open(path, 'ab', buffering=0)
+        try:
+            # Drop a partial record left by a crash in the middle of a write
+            size = fp.tell()
+            if size % RECORD.size:
+                size -= size % RECORD.size
+                fp.truncate(size)
+        except OSError:
+            fp.close()
+            raise
+        self.fp = fp
+        self.segment_start = start
+        self.segment_size = size
+
+    def _tag_id(self, tag) -> int:
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tags)
+            self.tags.append(tag)
+            self.tag_ids[tag] = tag_id
+            path = os.path.join(self.directory, TAGS_FILE)
+            with open(path + '.tmp', 'w') as fp:
+                json.dump(self.tags, fp)
+            os.replace(path + '.tmp', path)
+        return tag_id
+
+    def append(self, tag, ts: float, value: float):
+        self.buf += RECORD.pack(ts, self._tag_id(tag), value)
+        if len(self.buf) >= self.flush_bytes and time.monotonic() >= self.retry_at:
+            self.flush()
+
+    def flush_if_due(self):
+        if self.buf and time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buf:
+            return
+        first_ts = TIMESTAMP.unpack_from(self.buf, 0)[0]
+        written, error = 0, None
+        try:
+            if (self.fp is None or self.segment_size >= self.segment_bytes
+                    or first_ts - self.segment_start >= self.segment_seconds):
+                self._open_segment(first_ts, os.path.join(self.directory, segment_name(first_ts)))
+            with memoryview(self.buf) as view:
+                # An unbuffered write may be short, go on until all of it is down
+                while written < len(view):
+                    written += self.fp.write(view[written:])
+        except OSError as e:
+            # Only the text, the traceback would keep slices of buf alive
+            error = str(e)
+        if error is not None:
+            self._failed(written, error)
+            return
+        self.segment_size += written
+        self.records += written // RECORD.size
+        self.buf.clear()
+
+    def _failed(self, written: int, error: str):
+        """Keep the whole records that reached the file, cut off the rest and keep it buffered"""
+        kept = written - written % RECORD.size
+        if self.fp is not None:
+            try:
+                self.fp.truncate(self.segment_size + kept)
+            except OSError:
+                # Reopening trims a partial record at the end
+                self.fp.close()
+                self.fp = None
+        self.segment_size += kept
+        self.records += kept // RECORD.size
+        del self.buf[:kept]
+        excess = len(self.buf) - self.max_buffer
+        if excess > 0:
+            excess += -excess % RECORD.size
+            del self.buf[:excess]
+            self.dropped += excess // RECORD.size
+        self.retry_at = time.monotonic() + self.flush_seconds
+        log.error("history_log_failed dir=%s buffered=%d dropped=%d retry_s=%g error=%r",
+                  self.directory, len(self.buf) // RECORD.size, self.dropped,
+                  self.flush_seconds, error)
+
+    def close(self):
+        self.flush()
+        if self.buf:
+            log.error("history_log_lost dir=%s records=%d", self.directory, len(self.buf) // RECORD.size)
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def query(self, tag, t0: float, t1: float):
+        """Return (times, values) of tag for t0 <= ts < t1 from what has been flushed"""
+        return HistoryReader(self.directory).query(tag, t0, t1)
+
+
+class HistoryReader:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _first_at_or_after(self, mm, n: int, t: float) -> int:
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if TIMESTAMP.unpack_from(mm, mid * RECORD.size)[0] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def scan(self, t0: float, t1: float):
+        """Yield (tag id, ts, value) for every record with t0 <= ts < t1"""
+        segments = list_segments(self.directory)
+        for i, (start, path) in enumerate(segments):
+            if start - MAX_DISORDER >= t1:
+                break
+            if i + 1 < len(segments) and segments[i + 1][0] + MAX_DISORDER < t0:
+                continue
+            with open(path, 'rb') as fp:
+                n = os.fstat(fp.fileno()).st_size // RECORD.size
+                if not n:
+                    continue
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Everything before lo is older than t0 and everything
+                    # from hi on is at least t1, see MAX_DISORDER
+                    lo = self._first_at_or_after(mm, n, t0 - MAX_DISORDER)
+                    hi = self._first_at_or_after(mm, n, t1 + MAX_DISORDER)
+                    view = memoryview(mm)[lo * RECORD.size:hi * RECORD.size]
+                    try:
+                        for ts, tag_id, value in RECORD.iter_unpack(view):
+                            if t0 <= ts < t1:
+                                yield tag_id, ts, value
+                    finally:
+                        view.release()
+
+    def query(self, tag, t0: float, t1: float):
+        """Return (times, values) arrays of tag for t0 <= ts < t1"""
+        times, values = array('d'), array('d')
+        tags = load_tag_ids(self.directory)
+        if tag not in tags:
+            return times, values
+        wanted = tags.index(tag)
+        for tag_id, ts, value in self.scan(t0, t1):
+            if tag_id == wanted:
+                times.append(ts)
+                values.append(value)
+        return times, values
@@ -0,0 +1,184 @@
+"""
+SQLite history backend.
+
+An alternative to history_log.HistoryLog with the same sink interface:
+append(tag, ts, value), flush_if_due() and close(). Readings collect in a
+list and a writer thread inserts them with one executemany() and one
+commit per flush interval. The database runs in WAL mode, so readers
+(query(), the HTTP API) never block the writer and vice versa.
+
+readings(tag, ts, value) has an index on (tag, ts), so a per-sensor range
+query is an index range scan whatever the table size. With
+retention_days set, the writer thread also deletes expired rows, at most
+sweep_rows per flush and one tag at a time, so the sweep never holds the
+write lock for long.
+
+A failed flush or sweep (disk full, database locked past the busy
+timeout, a corrupt file) is logged and the writer carries on: the rows
+of a failed flush go back to the front of the pending list, the
+connection is opened again, and the next attempt waits twice as long as
+the last, up to MAX_BACKOFF seconds. While the database stays
+unwritable the pending list is capped at max_pending rows; readings
+beyond that are dropped and counted in dropped.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+
+log = logging.getLogger(__name__)
+
+MAX_BACKOFF = 300.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tags (
+    id  INTEGER PRIMARY KEY,
+    tag TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS readings (
+    tag   INTEGER NOT NULL,
+    ts    REAL NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS readings_tag_ts ON readings (tag, ts);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SqliteHistory:
+    def __init__(self, path: str, flush_seconds: float = 5.0,
+                 retention_days: float = 0.0, sweep_rows: int = 5000,
+                 max_pending: int = 500000):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self.sweep_rows = sweep_rows
+        self.max_pending = max_pending
+        self.records = 0
+        self.swept = 0
+        self.dropped = 0
+        self.errors = 0
+
+        conn = connect(path)
+        conn.executescript(SCHEMA)
+        self.tag_ids = dict((tag, tag_id) for tag_id, tag in conn.execute("SELECT id, tag FROM tags"))
+        conn.close()
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._local = threading.local()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, tag, ts: float, value: float):
+        with self._lock:
+            if len(self._pending) < self.max_pending:
+                self._pending.append((tag, ts, value))
+            else:
+                self.dropped += 1
+
+    def flush_if_due(self):
+        """The writer thread keeps its own schedule"""
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        conn = None
+        sweep_tag = 0
+        wait = self.flush_seconds
+        while True:
+            stopping = self._stop.wait(wait)
+            try:
+                if conn is None:
+                    conn = connect(self.path)
+                self._flush(conn)
+                if not stopping and self.retention_days > 0 and self.tag_ids:
+                    sweep_tag = self._sweep(conn, sweep_tag)
+                wait = self.flush_seconds
+            except sqlite3.Error as e:
+                self.errors += 1
+                wait = min(wait * 2, MAX_BACKOFF)
+                log.error("history_db_failed path=%s pending=%d dropped=%d retry_s=%g error=%r",
+                          self.path, len(self._pending), self.dropped, wait, str(e))
+                if conn is not None:
+                    conn.close()
+                    conn = None
+            if stopping:
+                break
+        if conn is not None:
+            conn.close()
+        if self._pending:
+            log.error("history_db_lost path=%s rows=%d", self.path, len(self._pending))
+
+    def _flush(self, conn: sqlite3.Connection):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        added = {}
+        try:
+            with conn:
+                rows = []
+                for tag, ts, value in pending:
+                    tag_id = self.tag_ids.get(tag)
+                    if tag_id is None:
+                        tag_id = added.get(tag)
+                    if tag_id is None:
+                        tag_id = conn.execute("INSERT INTO tags (tag) VALUES (?)", (tag,)).lastrowid
+                        added[tag] = tag_id
+                    rows.append((tag_id, ts, value))
+                conn.executemany("INSERT INTO readings (tag, ts, value) VALUES (?, ?, ?)", rows)
+        except sqlite3.Error:
+            # Rolled back: put the rows back in front of what came in since, oldest dropped past the cap
+            with self._lock:
+                pending += self._pending
+                excess = len(pending) - self.max_pending
+                if excess > 0:
+                    del pending[:excess]
+                    self.dropped += excess
+                self._pending = pending
+            raise
+        # Only ids of a committed transaction are kept
+        self.tag_ids.update(added)
+        self.records += len(rows)
+
+    def _sweep(self, conn: sqlite3.Connection, sweep_tag: int) -> int:
+        """Delete one chunk of expired rows of one tag, return the tag to sweep next"""
+        tag_ids = sorted(self.tag_ids.values())
+        tag_id = tag_ids[sweep_tag % len(tag_ids)]
+        cutoff = time.time() - self.retention_days * 86400
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM readings WHERE rowid IN "
+                "(SELECT rowid FROM readings WHERE tag = ? AND ts < ? LIMIT ?)",
+                (tag_id, cutoff, self.sweep_rows))
+        self.swept += cur.rowcount
+        # Stay on this tag while it still has a backlog of expired rows
+        return sweep_tag if cur.rowcount == self.sweep_rows else sweep_tag + 1
+
+    def query(self, tag, t0: float, t1: float):
+        """Return (times, values) arrays of tag for t0 <= ts < t1"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        times, values = array('d'), array('d')
+        for ts, value in conn.execute(
+                "SELECT r.ts, r.value FROM readings r JOIN tags t ON r.tag = t.id "
+                "WHERE t.tag = ? AND r.ts >= ? AND r.ts < ? ORDER BY r.ts",
+                (tag, t0, t1)):
+            times.append(ts)
+            values.append(value)
+        return times, values
@@ -0,0 +1,100 @@
+"""
+Pipeline latency histograms and throughput counters.
+
+Each stage of a reading's way from the UART to the dashboard gets a
+Histogram of durations in log2 buckets of microseconds: bucket b counts
+the durations d with 2**(b-1) <= d < 2**b us, bucket 0 the ones below
+1 us. Recording is a bit_length() and three additions, with no
+allocation, so the instrumentation stays on in production. Percentiles
+come from the buckets and are the bucket's upper bound, accurate to a
+factor of two, which is what is needed to tell 50 us from 50 ms.
+
+Every histogram has one writer thread (the ingest thread for parse and
+status, the Tk thread for paint and total). Readers take the counts as
+they are, a snapshot may be a reading or two out of step between
+stages. reset() swaps in fresh histograms instead of clearing them.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+
+BUCKETS = 32        # the last one collects everything above about 18 minutes
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds: float):
+        # Durations come from time.monotonic() and are never negative
+        us = int(seconds * 1e6)
+        b = us.bit_length()
+        self.counts[b if b < BUCKETS else BUCKETS - 1] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p: float) -> int:
+        """Upper bound in us of the bucket holding the p quantile, 0 when empty"""
+        if not self.count:
+            return 0
+        rank = p * self.count
+        seen = 0
+        for b, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(1 << b, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {'count': self.count,
+                'mean_us': self.total / self.count if self.count else 0.0,
+                'p50_us': self.percentile(0.5), 'p90_us': self.percentile(0.9),
+                'p99_us': self.percentile(0.99), 'max_us': self.max,
+                'buckets': {str(1 << b): n for b, n in enumerate(self.counts) if n}}
+
+
+class LatencyStats:
+    def __init__(self, stages, counters=()):
+        """stages and counters are names, kept in the given order"""
+        self.stage_names = tuple(stages)
+        self.counter_names = tuple(counters)
+        self.reset()
+
+    def reset(self):
+        self.stages = {name: Histogram() for name in self.stage_names}
+        self.counters = dict.fromkeys(self.counter_names, 0)
+        self.started = time.monotonic()
+        self.started_wall = time.time()
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage].record(seconds)
+
+    def add(self, counter: str, n: int = 1):
+        self.counters[counter] += n
+
+    def snapshot(self) -> dict:
+        """Stage histograms, counters and their average rates since the last reset"""
+        uptime = max(time.monotonic() - self.started, 1e-9)
+        counters = dict(self.counters)
+        return {'since': self.started_wall, 'seconds': uptime,
+                'stages': {name: hist.to_dict() for name, hist in self.stages.items()},
+                'counters': counters,
+                'rates': {name: n / uptime for name, n in counters.items()}}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def summary(self) -> str:
+        """One "stage=p50/p99/max" field per stage in ms, for the log"""
+        return " ".join("{0}={1:.2f}/{2:.2f}/{3:.2f}".format(
+            name, hist.percentile(0.5) / 1000, hist.percentile(0.99) / 1000, hist.max / 1000)
+            for name, hist in self.stages.items())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: str based parse_line() vs the bytes level FrameParser.
+
+The legacy path is the parse_line() the control room used before
+frame_parser.py: decode every line, print the text and the field list,
+split, look up, convert. With --sink null its prints go to /dev/null, the
+cheapest sink they can ever have. --sink pipe writes them into a pipe that
+another thread drains, which is closer to stdout under systemd/journald.
+
+The request behind frame_parser.py asked for 10x. On the development
+machine parse_block() reaches 3.5-3.8x the legacy path with prints and
+under 2x without; the single regex pass over the burst is most of what
+is left. The last line prints the measured ratio against that target.
+
+Usage:
+  python3 parser-bench1.py --frames 200000 --sink pipe
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from frame_parser import FrameParser
+from sensor_registry import SensorRegistry
+
+
+def legacy_parse_line(sensors, line, echo=True):
+    if line:
+        try:
+            text = line.decode("utf-8", errors="replace").rstrip("\r\n")
+        except Exception:
+            text = repr(line)
+        if (text[:1] == '<') and (text[-1:] == '>'):
+            if echo:
+                print(text)
+            text = text[1:-1]
+            fields = text.split(';')
+            if echo:
+                print(fields)
+            if len(fields) > 3 and fields[1] in sensors:
+                if fields[2] == sensors[fields[1]]['Type']:
+                    try:
+                        sensors[fields[1]]['Value'] = float(fields[3])
+                        sensors[fields[1]]['Updated'] = datetime.now()
+                    except:
+                        pass
+
+
+def make_frames(sensors, count):
+    # Derived sensors never arrive on the wire
+    tags = [tag for tag, d in sensors.items() if 'Derived' not in d]
+    frames = []
+    for i in range(count):
+        tag = random.choice(tags)
+        frames.append("<RFM;{0};{1};{2:.1f}>\r\n".format(
+            tag, sensors[tag]['Type'], random.uniform(-20.0, 30.0)).encode())
+    return frames
+
+
+def open_sink(kind):
+    if kind == 'null':
+        return open(os.devnull, 'w')
+    rfd, wfd = os.pipe()
+
+    def drain():
+        while os.read(rfd, 65536):
+            pass
+
+    threading.Thread(target=drain, daemon=True).start()
+    return os.fdopen(wfd, 'w')
+
+
+def bench(name, fn, frames, baseline=None):
+    t0 = time.perf_counter()
+    fn(frames)
+    dt = time.perf_counter() - t0
+    rate = len(frames) / dt
+    speedup = "" if baseline is None else "  x{0:.1f}".format(rate / baseline)
+    print("{0:28s} {1:10.0f} frames/s{2}".format(name, rate, speedup))
+    return rate
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Frame parser microbenchmark")
+    p.add_argument("--frames", type=int, default=200000)
+    p.add_argument("--sensors", default="sensor_dict.json")
+    p.add_argument("--sink", choices=("null", "pipe"), default="null",
+                   help="Where the legacy path prints to (default null)")
+    args = p.parse_args()
+
+    with open(args.sensors) as fp:
+        sensors = json.load(fp)
+    frames = make_frames(sensors, args.frames)
+
+    def legacy(frames):
+        with open_sink(args.sink) as sink, contextlib.redirect_stdout(sink):
+            for line in frames:
+                legacy_parse_line(sensors, line)
+
+    def legacy_quiet(frames):
+        for line in frames:
+            legacy_parse_line(sensors, line, echo=False)
+
+    parser = FrameParser(SensorRegistry.load(args.sensors))
+
+    block = b''.join(frames)
+
+    def per_line(frames):
+        for line in frames:
+            parser.parse(line)
+
+    def burst(frames):
+        parser.parse_block(block)
+
+    base = bench("legacy parse_line", legacy, frames)
+    bench("legacy without prints", legacy_quiet, frames, base)
+    bench("FrameParser.parse", per_line, frames, base)
+    rate = bench("FrameParser.parse_block", burst, frames, base)
+    print("rejected:", parser.rejected)
+    print("parse_block is x{0:.1f} the legacy path, target x10 {1}".format(
+        rate / base, "met" if rate >= 10 * base else "not met"))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,176 @@
+"""
+Field profiling for the control room (--profile DIR).
+
+Up to Python 3.11 cProfile hooks only the thread that enables it, so
+every profiled thread gets its own Profile, created on the first
+poll(name) made from inside that thread: the ingest thread polls from an
+engine timer, the Tk main loop from root.after(). A thread's profile is
+also written from inside that thread, on its next poll after
+request_dump(), so a dump never has to stop a thread from the outside.
+
+From Python 3.12 on cProfile is built on sys.monitoring: only one
+profiler can be active in the interpreter and it sees every thread. A
+per-thread split is not possible there, so the first poll starts one
+profile named "process" and the next poll after request_dump() writes
+it, whichever thread makes it. If another profiling tool (a debugger,
+say) is already active, profiling is logged as unavailable and the
+memory reports still run.
+
+The profiles are cumulative from the start; each dump writes
+NAME-STAMP.prof (for pstats or snakeviz) and NAME-STAMP.txt with the top
+functions by cumulative time.
+
+tracemalloc runs from start() on. The "profile" thread takes a snapshot
+every interval seconds and on request_dump() and appends the top growth
+against the previous snapshot and against the first one to
+memory-STAMP.txt. Steady growth of the same line against the first
+snapshot is what a leak looks like. Tracing every allocation slows
+the process down; --profile is for diagnostics, not for normal running.
+
+request_dump() only bumps a counter and sets an Event, so it is safe
+to call from a signal handler.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+log = logging.getLogger(__name__)
+
+# One profile per thread, or one for the whole interpreter (sys.monitoring)
+PER_THREAD = sys.version_info < (3, 12)
+TOP_FUNCTIONS = 40
+TOP_GROWTH = 20
+# Allocations made by the profiler itself
+IGNORE = (tracemalloc.Filter(False, tracemalloc.__file__),
+          tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+          tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+          tracemalloc.Filter(False, "<unknown>"))
+
+
+class ThreadProfile:
+    __slots__ = ('name', 'ident', 'profile', 'dumped')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ident = threading.get_ident()
+        self.profile = cProfile.Profile()
+        self.dumped = 0
+        self.profile.enable()
+
+    def dump(self, prefix: str, final: bool = False):
+        """
+        Write the .prof and .txt files. Per thread, call from the profiled
+        thread unless it has ended; the process profile from any thread.
+        """
+        self.profile.disable()
+        try:
+            self.profile.dump_stats(prefix + ".prof")
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            with open(prefix + ".txt", 'w') as f:
+                f.write(out.getvalue())
+        finally:
+            if not final:
+                self.profile.enable()
+
+
+class Profiler:
+    def __init__(self, directory: str, interval: float = 60.0, frames: int = 1):
+        self.directory = directory
+        self.interval = interval
+        self.frames = frames
+        self.stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.threads = {}
+        self.unavailable = False
+        self.requested = 0
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.first = None
+        self.last = None
+        self.samples = 0
+
+    def _prefix(self, name: str) -> str:
+        return os.path.join(self.directory, "{0}-{1}".format(name, self.stamp))
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tracemalloc.start(self.frames)
+        self.first = self.last = self._snapshot()
+        self.thread = threading.Thread(target=self._run, name="profile", daemon=True)
+        self.thread.start()
+        log.info("profile_start dir=%s interval_s=%g", self.directory, self.interval)
+
+    def poll(self, name: str):
+        """Call periodically from the thread to profile: starts its profile, dumps it when requested"""
+        if not PER_THREAD:
+            name = "process"
+        tp = self.threads.get(name)
+        if tp is None:
+            if self.unavailable:
+                return
+            try:
+                self.threads[name] = ThreadProfile(name)
+            except ValueError as e:
+                # "Another profiling tool is already active"
+                self.unavailable = True
+                log.warning("profile_unavailable thread=%s error=%r", name, str(e))
+        elif tp.dumped < self.requested:
+            tp.dumped = self.requested
+            tp.dump(self._prefix(name))
+            log.info("profile_dump thread=%s file=%s.prof", name, self._prefix(name))
+
+    def request_dump(self):
+        self.requested += 1
+        self.wake.set()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(IGNORE)
+
+    def _run(self):
+        while not self.stopping:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            if not self.stopping:
+                self.sample()
+
+    def sample(self):
+        """Append the top allocation growth since the last and the first snapshot"""
+        snap = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        self.samples += 1
+        with open(self._prefix("memory") + ".txt", 'a') as f:
+            f.write("=== {0} sample {1}: traced {2:.1f} KiB, peak {3:.1f} KiB\n".format(
+                time.strftime("%Y-%m-%d %H:%M:%S"), self.samples, current / 1024, peak / 1024))
+            for title, base in (("since last sample", self.last), ("since start", self.first)):
+                f.write("--- top growth {0}\n".format(title))
+                for stat in snap.compare_to(base, 'lineno')[:TOP_GROWTH]:
+                    f.write("{0}\n".format(stat))
+            f.write("\n")
+        self.last = snap
+
+    def close(self):
+        """
+        Final dump from the main thread after the other profiled threads
+        have ended: the caller's own profile first, as disabling another
+        thread's profile also clears the hook of the calling thread
+        """
+        self.stopping = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        me = threading.get_ident()
+        for tp in sorted(self.threads.values(), key=lambda tp: tp.ident != me):
+            tp.dump(self._prefix(tp.name), final=True)
+        self.sample()
+        tracemalloc.stop()
+        log.info("profile_stop dir=%s", self.directory)
@@ -0,0 +1,205 @@
+"""
+Per-sensor min/max/mean rollups at 1 minute, 1 hour and 1 day.
+
+Every resolution is a ring of buckets per sensor, held in flat arrays
+indexed by block * ring size + slot: the bucket key (minutes, hours
+or days of local time since the epoch) plus min, max, sum and count. A
+key maps to slot key % size, so a bucket is found without searching and
+a slot whose key is older than the one being written is simply reset.
+A sensor's rings are about 80 KB. They are allocated by its first
+reading, in the next free block, so sensors that are defined but never
+report (removed ones, spares, the other daemon's sensors) cost 16 bytes.
+
+Keys count local time, so day buckets run from local midnight to local
+midnight and "today" is the local day. The UTC offset is looked up once
+per hour of readings, not per reading.
+
+update() only touches the minute bucket. When a sensor's reading opens
+a new minute, the minute it leaves is folded into its hour and day
+buckets, once per sensor and minute; queries add the minute still open.
+A late reading for a minute that has already been folded goes into all
+three directly. So the per-reading cost is one bucket update whatever
+the number of resolutions.
+
+Not thread safe: the control room updates and queries under sensors_lock.
+
+The buckets only see the readings update() is given. The ingest paths
+give it every reading. A dashboard attached to a daemon's snapshot
+gets only the latest reading per sensor at each poll, so its minute
+buckets are thinned to one sample per poll and can miss short
+extremes.
+"""
+
+from __future__ import annotations
+
+import time
+from array import array
+
+# name -> (bucket seconds, buckets kept per sensor)
+RESOLUTIONS = {
+    '1m': (60, 1440),           # a day of minutes
+    '1h': (3600, 192),          # eight days of hours
+    '1d': (86400, 366),         # a year of days
+}
+# Keys are local minutes, the coarser keys are whole multiples of them
+MINUTES = {'1m': 1, '1h': 60, '1d': 1440}
+
+
+class Ring:
+    __slots__ = ('size', 'keys', 'mins', 'maxs', 'sums', 'counts')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.keys = array('q')
+        self.mins = array('d')
+        self.maxs = array('d')
+        self.sums = array('d')
+        self.counts = array('q')
+
+    def add(self):
+        """Allocate one more block of buckets"""
+        self.keys.extend(array('q', [-1]) * self.size)
+        for column in (self.mins, self.maxs, self.sums, self.counts):
+            column.extend(array(column.typecode, bytes(8 * self.size)))
+
+    def merge(self, block: int, key: int, lo: float, hi: float, total: float, n: int):
+        """Add stats to bucket key, reset the slot if it holds an older bucket, drop them if a newer"""
+        i = block * self.size + key % self.size
+        k = self.keys[i]
+        if k == key:
+            if lo < self.mins[i]:
+                self.mins[i] = lo
+            if hi > self.maxs[i]:
+                self.maxs[i] = hi
+            self.sums[i] += total
+            self.counts[i] += n
+        elif k < key:
+            self.keys[i] = key
+            self.mins[i] = lo
+            self.maxs[i] = hi
+            self.sums[i] = total
+            self.counts[i] = n
+
+    def get(self, block: int, key: int):
+        """(min, max, sum, count) of bucket key, None if it is empty or no longer kept"""
+        i = block * self.size + key % self.size
+        if self.keys[i] != key:
+            return None
+        return self.mins[i], self.maxs[i], self.sums[i], self.counts[i]
+
+
+class Rollups:
+    def __init__(self, count: int):
+        self.rings = {name: Ring(size) for name, (_, size) in RESOLUTIONS.items()}
+        self.minute = self.rings['1m']
+        self.blocks = 0
+        self.block = array('q', [-1]) * count        # ring block of each sensor, -1 = none yet
+        self.current = array('q', [-1]) * count      # open minute of each sensor
+        self.offset = 0
+        self.offset_from = 0.0
+        self.offset_until = 0.0
+
+    def add(self):
+        """A newly registered sensor id, its rings come with its first reading"""
+        self.block.append(-1)
+        self.current.append(-1)
+
+    def _allocate(self, tid: int) -> int:
+        for ring in self.rings.values():
+            ring.add()
+        block = self.block[tid] = self.blocks
+        self.blocks += 1
+        return block
+
+    def _offset(self, ts: float) -> int:
+        """UTC offset of local time at ts, cached for the hour around it"""
+        offset = time.localtime(ts).tm_gmtoff
+        self.offset = offset
+        self.offset_from = ts - (ts + offset) % 3600
+        self.offset_until = self.offset_from + 3600
+        return offset
+
+    def key(self, ts: float) -> int:
+        """Local minutes since the epoch"""
+        offset = self.offset if self.offset_from <= ts < self.offset_until else self._offset(ts)
+        return int((ts + offset) // 60)
+
+    def start(self, local: float) -> float:
+        """Epoch time of a moment given in local seconds since the epoch, using the UTC offset in force then"""
+        ts = local - self.offset
+        return local - time.localtime(ts).tm_gmtoff
+
+    def update(self, tid: int, ts: float, value: float):
+        key = self.key(ts)
+        block = self.block[tid]
+        if block < 0:
+            block = self._allocate(tid)
+        current = self.current[tid]
+        m = self.minute
+        if key == current:
+            i = block * m.size + key % m.size
+            if value < m.mins[i]:
+                m.mins[i] = value
+            if value > m.maxs[i]:
+                m.maxs[i] = value
+            m.sums[i] += value
+            m.counts[i] += 1
+        elif key > current:
+            if current >= 0:
+                self._fold(block, current)
+            m.merge(block, key, value, value, value, 1)
+            self.current[tid] = key
+        else:
+            # Late reading, its minute is already in the hour and day buckets
+            m.merge(block, key, value, value, value, 1)
+            self.rings['1h'].merge(block, key // 60, value, value, value, 1)
+            self.rings['1d'].merge(block, key // 1440, value, value, value, 1)
+
+    def _fold(self, block: int, key: int):
+        stats = self.minute.get(block, key)
+        if stats is not None:
+            self.rings['1h'].merge(block, key // 60, *stats)
+            self.rings['1d'].merge(block, key // 1440, *stats)
+
+    def stats(self, tid: int, resolution: str, key: int):
+        """(min, max, sum, count) of one bucket including the open minute, None if empty"""
+        block = self.block[tid]
+        if block < 0:
+            return None
+        stats = self.rings[resolution].get(block, key)
+        current = self.current[tid]
+        if resolution == '1m' or current < 0 or current // MINUTES[resolution] != key:
+            return stats
+        open_minute = self.minute.get(block, current)
+        if open_minute is None:
+            return stats
+        if stats is None:
+            return open_minute
+        return (min(stats[0], open_minute[0]), max(stats[1], open_minute[1]),
+                stats[2] + open_minute[2], stats[3] + open_minute[3])
+
+    def series(self, tid: int, resolution: str, t0: float, t1: float) -> list:
+        """[(start ts, min, max, mean, count)] of the non-empty buckets between t0 and t1, oldest first"""
+        seconds, size = RESOLUTIONS[resolution]
+        step = MINUTES[resolution]
+        last = self.key(t1) // step
+        first = max(self.key(t0) // step, last - size + 1)
+        rows = []
+        for key in range(first, last + 1):
+            stats = self.stats(tid, resolution, key)
+            if stats is not None:
+                lo, hi, total, n = stats
+                rows.append((self.start(key * seconds), lo, hi, total / n, n))
+        return rows
+
+    def today(self, tid: int, now: float = None):
+        """(min, max, mean, count) of the local day so far, None before the first reading"""
+        stats = self.stats(tid, '1d', self.key(time.time() if now is None else now) // 1440)
+        if stats is None:
+            return None
+        lo, hi, total, n = stats
+        return lo, hi, total / n, n
+
+    def nbytes(self) -> int:
+        return (sum(5 * 8 * len(ring.keys) for ring in self.rings.values())
+                + 8 * (len(self.block) + len(self.current)))
@@ -0,0 +1,98 @@
+"""
+Fixed-memory reading history per sensor.
+
+Every sensor id gets a RingBuffer with two preallocated array('d') columns,
+timestamps (epoch seconds) and values. Appending is O(1) and overwrites
+the oldest sample once the buffer is full, so memory is set by the
+capacity alone and stays flat however long the Pi has been up. Windowed
+reads binary search the timestamps instead of scanning.
+"""
+
+from __future__ import annotations
+
+import time
+from array import array
+
+
+class RingBuffer:
+    __slots__ = ('capacity', 'times', 'values', 'head', 'count')
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0           # next slot to write
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, ts: float, value: float):
+        i = self.head
+        self.times[i] = ts
+        self.values[i] = value
+        self.head = i + 1 if i + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _slot(self, n: int) -> int:
+        """Array index of the n:th oldest sample"""
+        return (self.head - self.count + n) % self.capacity
+
+    def first(self):
+        """Return (ts, value) of the oldest sample still held, None when empty"""
+        if not self.count:
+            return None
+        i = self._slot(0)
+        return self.times[i], self.values[i]
+
+    def last(self):
+        """Return (ts, value) of the newest sample, None when empty"""
+        if not self.count:
+            return None
+        i = self.head - 1
+        return self.times[i], self.values[i]
+
+    def since(self, t0: float):
+        """Return (times, values) arrays of the samples with ts >= t0, oldest first"""
+        times = self.times
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[self._slot(mid)] < t0:
+                lo = mid + 1
+            else:
+                hi = mid
+        n = self.count - lo
+        if not n:
+            return array('d'), array('d')
+        start = self._slot(lo)
+        end = start + n
+        if end <= self.capacity:
+            return times[start:end], self.values[start:end]
+        end -= self.capacity
+        return times[start:] + times[:end], self.values[start:] + self.values[:end]
+
+
+class SensorHistory:
+    def __init__(self, count: int, capacity: int):
+        self.capacity = capacity
+        self.buffers = [RingBuffer(capacity) for _ in range(count)]
+
+    def add(self):
+        """Allocate the buffer of a newly registered sensor id"""
+        self.buffers.append(RingBuffer(self.capacity))
+
+    def append(self, tid: int, ts: float, value: float):
+        self.buffers[tid].append(ts, value)
+
+    def window(self, tid: int, seconds: float, now: float = None):
+        """Return (times, values) of sensor tid for the last seconds"""
+        if now is None:
+            now = time.time()
+        return self.buffers[tid].since(now - seconds)
+
+    def nbytes(self) -> int:
+        return sum(2 * 8 * b.capacity for b in self.buffers)
@@ -0,0 +1,148 @@
+"""
+Sensor registry.
+
+Definitions come from sensor_dict.json (or any file of the same shape):
+
+    {"VA1_T": {"Sensor": "MH1", "Type": "Temp", "Min": 10.0, "Max": 30.0}, ...}
+
+An entry with a "Derived" key is computed from other sensors instead of
+read from the serial port, see derived_metrics.py.
+
+Every sensor gets an integer id in file order and all per-sensor data lives
+in parallel columns indexed by that id: plain lists for the strings and
+array('d') for the numbers. The hot paths (frame parsing, status, history)
+only pass ids around; the tag string is needed for display and for the
+on-disk history formats. A sensor costs a few dozen bytes plus its
+strings, so thousands of sensors stay small.
+
+apply_definitions() merges a re-read file into a running registry. Ids
+are never reused or renumbered: a sensor dropped from the file is only
+marked inactive, and it gets its old id back if it returns.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from array import array
+
+
+def load_definitions(path: str) -> list:
+    """Read a definitions file, return [(tag, location, type, min, max, derived)]"""
+    with open(path) as fp:
+        defs = json.load(fp)
+    return [(tag, str(d['Sensor']).strip(), str(d['Type']), float(d['Min']), float(d['Max']),
+             d.get('Derived'))
+            for tag, d in defs.items()]
+
+
+def write_definitions(path: str, defs: dict):
+    """
+    Merge defs into the file at path and replace it atomically, readers
+    see either the old or the new file. Keys of an entry that the registry
+    does not know about, and entries it does not hold (added to the file
+    since the last reload), are kept as they are.
+    """
+    try:
+        with open(path) as fp:
+            merged = json.load(fp)
+    except FileNotFoundError:
+        merged = {}
+    for tag, d in defs.items():
+        entry = merged.setdefault(tag, {})
+        entry.update(d)
+        if 'Derived' not in d:
+            entry.pop('Derived', None)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(merged, fp, indent=4)
+        fp.write('\n')
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, path)
+
+
+class SensorRegistry:
+    def __init__(self):
+        self.tags = []              # id -> tag
+        self.ids = {}               # tag -> id
+        self.locations = []
+        self.types = []
+        self.values = array('d')
+        self.mins = array('d')
+        self.maxs = array('d')
+        self.updated = array('d')   # epoch seconds of the last reading, 0.0 = never
+        self.active = bytearray()   # 0 once the sensor has been removed from the file
+        self.derived = []           # id -> "Derived" spec dict, None for a serial sensor
+
+    @classmethod
+    def load(cls, path: str) -> 'SensorRegistry':
+        registry = cls()
+        registry.apply_definitions(load_definitions(path))
+        return registry
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __contains__(self, tag):
+        return tag in self.ids
+
+    def add(self, tag, location, type_, min_value, max_value, derived=None) -> int:
+        if tag in self.ids:
+            raise ValueError("duplicate sensor tag {0}".format(tag))
+        tid = len(self.tags)
+        self.tags.append(tag)
+        self.ids[tag] = tid
+        self.locations.append(location.strip())
+        self.types.append(type_)
+        self.values.append(0.0)
+        self.mins.append(float(min_value))
+        self.maxs.append(float(max_value))
+        self.updated.append(0.0)
+        self.active.append(1)
+        self.derived.append(derived)
+        return tid
+
+    def active_ids(self) -> list:
+        return [tid for tid in range(len(self.tags)) if self.active[tid]]
+
+    def apply_definitions(self, defs: list):
+        """
+        Merge [(tag, location, type, min, max, derived)] into the registry,
+        return the ids that were (added, removed, changed)
+        """
+        added, changed = [], []
+        seen = set()
+        for tag, location, type_, min_value, max_value, derived in defs:
+            tid = self.ids.get(tag)
+            if tid is None:
+                added.append(self.add(tag, location, type_, min_value, max_value, derived))
+                seen.add(added[-1])
+                continue
+            seen.add(tid)
+            if not self.active[tid]:
+                self.active[tid] = 1
+                added.append(tid)
+            elif (self.locations[tid], self.types[tid], self.mins[tid], self.maxs[tid],
+                  self.derived[tid]) != (location, type_, min_value, max_value, derived):
+                changed.append(tid)
+            self.locations[tid] = location
+            self.types[tid] = type_
+            self.mins[tid] = min_value
+            self.maxs[tid] = max_value
+            self.derived[tid] = derived
+        removed = [tid for tid in self.active_ids() if tid not in seen]
+        for tid in removed:
+            self.active[tid] = 0
+        return added, removed, changed
+
+    def definitions(self) -> dict:
+        """Return the definitions of the active sensors in sensor_dict.json form"""
+        defs = {}
+        for tid in self.active_ids():
+            d = {'Sensor': self.locations[tid], 'Type': self.types[tid],
+                 'Min': self.mins[tid], 'Max': self.maxs[tid]}
+            if self.derived[tid] is not None:
+                d['Derived'] = self.derived[tid]
+            defs[self.tags[tid]] = d
+        return defs
@@ -0,0 +1,106 @@
+"""
+Event driven sensor status.
+
+The status of a sensor only changes when a reading arrives, when its
+Min/Max thresholds are edited or when it has been silent for stale_after
+seconds. StatusEngine evaluates Min/Max on the first two and keeps a
+min-heap of "goes stale at" deadlines on time.monotonic() for the third,
+so a tick costs O(expired sensors * log n), not O(all sensors).
+
+Sensors are addressed by registry id. The heap holds at most one entry per
+sensor, queued[tid] says whether it has one. A reading only moves the
+sensor's deadline; when an entry pops whose deadline has since been
+moved, it is pushed back with the new one instead of going OUTDATED.
+"""
+
+from __future__ import annotations
+
+import heapq
+import time
+from array import array
+
+SENSOR_STATUS_OK = 0
+SENSOR_STATUS_NO_DATA = 1
+SENSOR_STATUS_OUTDATED = 2
+SENSOR_STATUS_HIGH_TEMPERATURE = 3
+SENSOR_STATUS_LOW_TEMPERATURE = 4
+
+# For logs, snapshot-view.py and the HTTP API
+STATUS_NAMES = {
+    SENSOR_STATUS_OK: 'OK',
+    SENSOR_STATUS_NO_DATA: 'NO_DATA',
+    SENSOR_STATUS_OUTDATED: 'OUTDATED',
+    SENSOR_STATUS_HIGH_TEMPERATURE: 'HIGH',
+    SENSOR_STATUS_LOW_TEMPERATURE: 'LOW',
+}
+
+STALE_AFTER = 45.0
+
+
+class StatusEngine:
+    def __init__(self, sensors, stale_after: float = STALE_AFTER):
+        self.sensors = sensors
+        self.stale_after = stale_after
+        self.status = bytearray([SENSOR_STATUS_NO_DATA]) * len(sensors)
+        self.deadline = array('d', bytes(8 * len(sensors)))     # 0.0 = cannot go stale
+        self.queued = bytearray(len(sensors))                   # 1 = has a heap entry
+        self.heap = []
+
+    def add_sensor(self):
+        """The registry got a new id"""
+        self.status.append(SENSOR_STATUS_NO_DATA)
+        self.deadline.append(0.0)
+        self.queued.append(0)
+
+    def forget(self, tid: int):
+        """tid was removed or has no valid value any more, its heap entry is dropped when it pops"""
+        self.status[tid] = SENSOR_STATUS_NO_DATA
+        self.deadline[tid] = 0.0
+
+    def limit_status(self, tid: int) -> int:
+        value = self.sensors.values[tid]
+        if value < self.sensors.mins[tid]:
+            return SENSOR_STATUS_LOW_TEMPERATURE
+        if value > self.sensors.maxs[tid]:
+            return SENSOR_STATUS_HIGH_TEMPERATURE
+        return SENSOR_STATUS_OK
+
+    def on_reading(self, tid: int, now: float = None):
+        """A new value was stored for sensor tid"""
+        if now is None:
+            now = time.monotonic()
+        if not self.queued[tid]:
+            heapq.heappush(self.heap, (now + self.stale_after, tid))
+            self.queued[tid] = 1
+        self.deadline[tid] = now + self.stale_after
+        self.status[tid] = self.limit_status(tid)
+
+    def thresholds_changed(self, tid: int):
+        """Min or Max of tid was edited, re-evaluate unless it has no fresh value"""
+        if self.status[tid] not in (SENSOR_STATUS_NO_DATA, SENSOR_STATUS_OUTDATED):
+            self.status[tid] = self.limit_status(tid)
+
+    def expire(self, now: float = None) -> list:
+        """Mark every sensor whose deadline has passed OUTDATED, return their ids"""
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            _, tid = heapq.heappop(heap)
+            deadline = self.deadline[tid]
+            if not deadline:
+                self.queued[tid] = 0
+                continue
+            if deadline > now:
+                heapq.heappush(heap, (deadline, tid))
+                continue
+            self.deadline[tid] = 0.0
+            self.queued[tid] = 0
+            self.status[tid] = SENSOR_STATUS_OUTDATED
+            expired.append(tid)
+        return expired
+
+    def next_deadline(self):
+        """Monotonic time of the earliest heap entry, None when nothing can go stale"""
+        return self.heap[0][0] if self.heap else None
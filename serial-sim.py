@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Serial port simulator for running the control room without a Raspberry Pi.
+
+Opens a pseudo-terminal pair and writes <node;TAG;Type;value> frames to
+the master side. Point the application at the slave side:
+
+  python3 serial-sim.py --sensors 9 --rate 50 --link /tmp/ttyVA0
+  python3 T2511_VA_ControlRoom1.py --port /tmp/ttyVA0
+
+--binary sends the 12-byte frames of binary_frames.py instead, for a
+control room started with --framing binary (or auto). --corrupt P flips
+one random byte in a fraction P of the frames, to watch the CRC and
+resync counters in the summary log:
+
+  python3 serial-sim.py --binary --corrupt 0.01 --rate 2000 --link /tmp/ttyVA0
+  python3 T2511_VA_ControlRoom1.py --port /tmp/ttyVA0 --framing binary
+
+Tags and types come from sensor_dict.json (derived sensors are skipped);
+when --sensors asks for more than the file defines, extra SIMnnnn_T
+temperature tags are generated.
+--write-definitions saves the simulated set in sensor_dict.json form so the
+application can load it (SENSOR_FILE=...). Values follow a slow random walk
+per sensor.
+
+A pty has no baud rate, so --rate is the only limit. When the reader does
+not keep up, the pty buffer fills; frames that no longer fit are dropped
+and counted, the same way a real UART overruns. Once a second the achieved
+rate and the drop count are printed, so the point where the application
+saturates is easy to see. Frames fall due by the time that actually
+passed, not by the nominal tick, so a slow loop does not lower the rate,
+and a frame counts as sent once its last byte is in the pty.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import time
+import tty
+from collections import deque
+
+from binary_frames import encode_frame
+
+TICK = 0.01
+MAX_PENDING = 64 * 1024
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Serial frame simulator on a pty")
+    p.add_argument("--sensors", "-n", type=int, default=0,
+                   help="Number of simulated sensors (default: all in the definitions file)")
+    p.add_argument("--rate", "-r", type=float, default=10.0,
+                   help="Total frames per second over all sensors (default 10)")
+    p.add_argument("--definitions", default="sensor_dict.json",
+                   help="Sensor definitions to take tags and types from")
+    p.add_argument("--write-definitions", default="",
+                   help="Write definitions for the simulated sensors to this file")
+    p.add_argument("--link", default="",
+                   help="Create a symlink with this name pointing to the pty slave")
+    p.add_argument("--node", default="SIM",
+                   help="Node name put in the first frame field (default SIM)")
+    p.add_argument("--binary", action="store_true",
+                   help="Send binary frames with a CRC instead of ASCII lines")
+    p.add_argument("--corrupt", type=float, default=0.0,
+                   help="Fraction of frames with one byte flipped (default 0)")
+    p.add_argument("--duration", type=float, default=0.0,
+                   help="Stop after this many seconds (default: run until Ctrl-C)")
+    return p.parse_args()
+
+
+def load_tags(path: str, count: int) -> list:
+    """Return [(tag, type)] for count sensors"""
+    try:
+        with open(path) as fp:
+            defs = json.load(fp)
+        tags = [(tag, defs[tag]['Type']) for tag in defs if 'Derived' not in defs[tag]]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not read {path}: {e}, generating all tags")
+        tags = []
+    if count <= 0:
+        count = len(tags)
+    tags = tags[:count]
+    for i in range(len(tags), count):
+        tags.append(("SIM{0:04d}_T".format(i), 'Temp'))
+    return tags
+
+
+def write_definitions(path: str, tags: list):
+    defs = {tag: {'Sensor': tag.split('_')[0], 'Type': type_, 'Min': 10.0, 'Max': 30.0}
+            for tag, type_ in tags}
+    with open(path, 'w') as fp:
+        json.dump(defs, fp, indent=4)
+        fp.write('\n')
+
+
+def open_pty(link: str):
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    name = os.ttyname(slave)
+    if link:
+        try:
+            os.unlink(link)
+        except FileNotFoundError:
+            pass
+        os.symlink(name, link)
+    return master, slave, name
+
+
+def run(args) -> int:
+    tags = load_tags(args.definitions, args.sensors)
+    if not tags:
+        print("No sensors to simulate")
+        return 1
+    if args.write_definitions:
+        write_definitions(args.write_definitions, tags)
+    master, slave, name = open_pty(args.link)
+    print(f"Simulating {len(tags)} sensors at {args.rate:g} {'binary' if args.binary else 'ASCII'} frames/s on {name}"
+          + (f" ({args.link})" if args.link else ""))
+
+    node = args.node
+    values = [random.uniform(5.0, 25.0) for _ in tags]
+    pending = bytearray()
+    lengths = deque()       # length of every frame in pending, oldest first
+    written_head = 0        # bytes of the oldest pending frame already written
+    sent = dropped = corrupted = 0
+    report_sent = report_dropped = 0
+    next_sensor = 0
+    t_start = time.monotonic()
+    t_report = t_start + 1.0
+    t_last = t_start
+    due = 0.0
+
+    try:
+        while not args.duration or time.monotonic() - t_start < args.duration:
+            now = time.monotonic()
+            due += args.rate * (now - t_last)
+            t_last = now
+            n = int(due)
+            due -= n
+            for _ in range(n):
+                i = next_sensor
+                next_sensor = (next_sensor + 1) % len(tags)
+                values[i] += random.uniform(-0.2, 0.2)
+                if args.binary:
+                    frame = encode_frame(tags[i][0], tags[i][1], round(values[i], 1))
+                else:
+                    frame = "<{0};{1};{2};{3:.1f}>\r\n".format(
+                        node, tags[i][0], tags[i][1], values[i]).encode('ascii')
+                if args.corrupt and random.random() < args.corrupt:
+                    frame = bytearray(frame)
+                    frame[random.randrange(len(frame))] ^= 1 << random.randrange(8)
+                    corrupted += 1
+                if len(pending) < MAX_PENDING:
+                    pending += frame
+                    lengths.append(len(frame))
+                else:
+                    dropped += 1
+            if pending:
+                try:
+                    written = os.write(master, pending)
+                except BlockingIOError:
+                    written = 0
+                del pending[:written]
+                written_head += written
+                while lengths and written_head >= lengths[0]:
+                    written_head -= lengths.popleft()
+                    sent += 1
+
+            if now >= t_report:
+                print("sent {0:8.0f} frames/s  dropped {1:6d}  pending {2:6d} bytes".format(
+                      sent - report_sent, dropped - report_dropped, len(pending)))
+                report_sent, report_dropped = sent, dropped
+                t_report += 1.0
+
+            delay = now + TICK - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.link:
+            try:
+                os.unlink(args.link)
+            except OSError:
+                pass
+        os.close(master)
+        os.close(slave)
+    print(f"Total sent {sent} frames, dropped {dropped}, corrupted {corrupted}, unsent {len(lengths)}")
+    return 0
+
+
+def main() -> int:
+    return run(parse_args())
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
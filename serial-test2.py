@@ -1,6 +1,10 @@
 import serial
 import RPi.GPIO as GPIO
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # Raspberry Pi GPIO UART Configuration
 # GPIO 14 (TXD) - Pin 8
@@ -8,16 +12,40 @@ import time
 # Ground      - Pin 6
 
 class RaspberryPiSerial:
-    def __init__(self, device='/dev/serial0', baudrate=9600):
+    # How often the reader wakes up to expire timed out commands when the
+    # line is silent; it does not delay responses, read() returns as soon
+    # as bytes arrive
+    READ_TICK = 0.05
+
+    def __init__(self, device='/dev/serial0', baudrate=9600, terminator=b'\r\n', timeout=1.0):
         """
         /dev/serial0 - Primary UART (GPIO 14/15)
         /dev/ttyAMA0 - Hardware UART (Pi 3/4)
         /dev/ttyS0 - Mini UART (Pi 3/4)
+
+        Every command gets exactly one response, the bytes up to the next
+        terminator. Several commands may be in flight: responses are
+        matched to them in the order they were sent. A command with no
+        response within its timeout fails with TimeoutError but keeps its
+        place until the commands sent before it are answered or expired;
+        a device that answers even later would shift the matching, so the
+        timeout has to be above the device's worst case. The response of
+        a command that was cancelled or has timed out is discarded.
         """
         self.device = device
         self.baudrate = baudrate
+        self.terminator = terminator
+        self.timeout = timeout
         self.serial = None
-        
+        self.buf = bytearray()
+        self.pending = deque()      # (Future, deadline) in send order
+        self.lock = threading.Lock()
+        self.reader = None
+        self.running = False
+        self.on_unsolicited = None  # callback(line) for lines nobody asked for
+        self.unsolicited = 0
+        self.timeouts = 0
+
     def connect(self):
         """Connect to Raspberry Pi UART"""
         try:
@@ -27,35 +55,156 @@ class RaspberryPiSerial:
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
                 bytesize=serial.EIGHTBITS,
-                timeout=1
+                timeout=self.READ_TICK
             )
-            return True
         except serial.SerialException as e:
             print(f"Failed to connect: {e}")
             return False
-            
-    def send_command(self, command):
-        """Send command and read response"""
+        self.running = True
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+        return True
+
+    def _read_loop(self):
+        term = self.terminator
+        buf = self.buf
+        try:
+            while self.running:
+                try:
+                    data = self.serial.read(self.serial.in_waiting or 1)
+                except (serial.SerialException, OSError, TypeError) as e:
+                    # TypeError: pyserial's read on a port closed under it
+                    if self.running:
+                        print(f"Serial read failed: {e}")
+                    break
+                if data:
+                    buf += data
+                    start = 0
+                    while True:
+                        end = buf.find(term, start)
+                        if end < 0:
+                            break
+                        line = bytes(buf[start:end])
+                        start = end + len(term)
+                        if line:
+                            self._deliver(line)
+                    del buf[:start]
+                self._expire()
+        finally:
+            # Whatever ended the reader, nobody is left to answer the waiters
+            self.running = False
+            self._fail_pending(ConnectionError("serial port closed"))
+
+    @staticmethod
+    def _settle(fut, result=None, error=None):
+        """Complete fut unless it was cancelled or timed out, return True if it was completed"""
+        if fut.done():
+            return False
+        try:
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+        except InvalidStateError:
+            # Cancelled between the check and here
+            return False
+        return True
+
+    def _deliver(self, line):
+        with self.lock:
+            fut = self.pending.popleft()[0] if self.pending else None
+        if fut is None:
+            self.unsolicited += 1
+            if self.on_unsolicited is not None:
+                try:
+                    self.on_unsolicited(line)
+                except Exception as e:
+                    print(f"Unsolicited line handler failed: {e!r}")
+        else:
+            self._settle(fut, line.decode(errors='replace').strip())
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            # Expired commands at the head give up their place, the ones
+            # behind an older command keep it so its response still lines up
+            while self.pending and self.pending[0][1] <= now:
+                expired.append(self.pending.popleft()[0])
+            expired += [fut for fut, deadline in self.pending if deadline <= now and not fut.done()]
+        for fut in expired:
+            if self._settle(fut, error=TimeoutError("no response within timeout")):
+                self.timeouts += 1
+
+    def _fail_pending(self, error):
+        with self.lock:
+            pending, self.pending = self.pending, deque()
+        for fut, _ in pending:
+            self._settle(fut, error=error)
+
+    def send_command_async(self, command, timeout=None, callback=None):
+        """
+        Send command without waiting, return a Future of the response
+        string. callback(future) runs in the reader thread when it is done.
+        """
+        fut = Future()
+        if callback is not None:
+            fut.add_done_callback(callback)
+        if not self.serial or not self.running:
+            fut.set_exception(ConnectionError("not connected"))
+            return fut
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        # Queue and write under one lock so the response order matches
+        error = None
+        with self.lock:
+            self.pending.append((fut, deadline))
+            try:
+                self.serial.write(command.encode() + self.terminator)
+            except (serial.SerialException, OSError) as e:
+                # Nothing went out, so no response will come for it
+                self.pending.pop()
+                error = e
+        if error is not None:
+            self._settle(fut, error=error)
+        return fut
+
+    def send_command(self, command, timeout=None):
+        """Send command and wait for its response, None on timeout"""
         if not self.serial:
             return None
-            
-        self.serial.write(command.encode() + b'\r\n')
-        time.sleep(0.1)
-        
-        response = b''
-        while self.serial.in_waiting:
-            response += self.serial.read(self.serial.in_waiting)
-            time.sleep(0.1)
-            
-        return response.decode().strip()
-        
+        timeout = self.timeout if timeout is None else timeout
+        fut = self.send_command_async(command, timeout)
+        try:
+            # The reader fails the future at the deadline, this is only a
+            # backstop in case the reader is stuck
+            return fut.result(timeout + 2 * self.READ_TICK + 1)
+        except (TimeoutError, FutureTimeoutError, ConnectionError, serial.SerialException, OSError) as e:
+            if not fut.done():
+                fut.cancel()
+                e = "reader did not answer"
+            print(f"Command {command!r} failed: {e}")
+            return None
+
     def close(self):
+        self.running = False
+        if self.reader:
+            self.reader.join(2 * self.READ_TICK + 1)
         if self.serial:
             self.serial.close()
+            self.serial = None
+        self._fail_pending(ConnectionError("serial port closed"))
 
 # Basic usage
 pi_serial = RaspberryPiSerial('/dev/serial0', 115200)
 if pi_serial.connect():
     response = pi_serial.send_command('AT')
     print(f"Response: {response}")
-    pi_serial.close()
\ No newline at end of file
+
+    # Pipelined: all three are on the wire before the first answer is back
+    futures = [pi_serial.send_command_async(cmd) for cmd in ('AT', 'AT+GMR', 'AT+CSQ')]
+    for fut in futures:
+        try:
+            print(f"Response: {fut.result()}")
+        except TimeoutError:
+            print("No response")
+    pi_serial.close()
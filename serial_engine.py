@@ -0,0 +1,163 @@
+"""
+asyncio serial ingestion engine.
+
+The engine runs its own event loop in a background thread, so the Tk
+main loop keeps the main thread. Every SerialPort is opened non-blocking
+and its file descriptor is watched with loop.add_reader(): the loop
+sleeps in the selector until a port has bytes, drains them, splits the
+complete lines off the port's bytearray buffer and hands the block to
+apply(port, block). Whatever apply() returns (a batch) is published to
+every subscriber's bounded asyncio.Queue, and each subscriber's async
+handler consumes its queue in its own task.
+
+Nothing polls: a failed port is reopened by a loop.call_later() timer,
+housekeeping registered with every() runs on timers (one that raises is
+logged and runs again on schedule), and stop() wakes the loop through
+call_soon_threadsafe() so shutdown takes effect at once;
+batches still queued are handed to their subscribers before it returns.
+A subscriber that falls behind has batches dropped and counted in
+dropped[name]; it never holds up the reader.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+
+from serial.serialutil import SerialException
+
+log = logging.getLogger(__name__)
+
+
+class IngestEngine:
+    def __init__(self, ports, apply, reopen_delay: float = 5.0):
+        """apply(port, block) runs in the engine thread and returns a batch or None"""
+        self.ports = ports
+        self.apply = apply
+        self.reopen_delay = reopen_delay
+        self.loop = None
+        self.thread = None
+        self.dropped = {}
+        self._subscribers = []
+        self._timers = []
+        self._queues = []
+        self._stopping = None
+        self._started = threading.Event()
+        self._failing = set()       # ports whose reopen failure was already logged
+
+    def subscribe(self, name: str, handler, maxsize: int = 1000):
+        """Register an async handler(batch), call before start()"""
+        self._subscribers.append((name, handler, maxsize))
+        self.dropped[name] = 0
+
+    def every(self, seconds: float, fn):
+        """Run fn() in the engine thread every seconds, call before start()"""
+        self._timers.append((seconds, fn))
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="ingest", daemon=True)
+        self.thread.start()
+        self._started.wait()
+
+    def stop(self, timeout: float = 2.0):
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self._stopping.set)
+            self.thread.join(timeout)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _main(self):
+        self._stopping = asyncio.Event()
+        tasks = []
+        for name, handler, maxsize in self._subscribers:
+            queue = asyncio.Queue(maxsize)
+            self._queues.append((name, queue, handler))
+            tasks.append(asyncio.create_task(self._consume(name, queue, handler)))
+        for seconds, fn in self._timers:
+            self._schedule(seconds, fn)
+        for port in self.ports:
+            self._open(port)
+        self._started.set()
+
+        await self._stopping.wait()
+
+        for port in self.ports:
+            if port.ser is not None:
+                self.loop.remove_reader(port.fileno())
+                port.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Hand what is already queued to the subscribers before the loop closes
+        for name, queue, handler in self._queues:
+            while not queue.empty():
+                await self._handle(name, handler, queue.get_nowait())
+
+    def _schedule(self, seconds: float, fn):
+        def tick():
+            try:
+                fn()
+            except Exception as e:
+                # A failing timer (full SD card, oversized catalog) must
+                # still run again, it may succeed next time
+                log.exception("timer_failed fn=%s error=%r", getattr(fn, '__qualname__', fn), e)
+            self.loop.call_later(seconds, tick)
+        self.loop.call_later(seconds, tick)
+
+    def _open(self, port):
+        try:
+            port.open()
+            self.loop.add_reader(port.fileno(), self._on_readable, port)
+            self._failing.discard(port)
+            log.info("port_open port=%s baud=%d", port.port, port.baud)
+        except (SerialException, OSError) as e:
+            port.close()
+            port.errors += 1
+            # Log a dead port once, not on every retry
+            level = logging.DEBUG if port in self._failing else logging.WARNING
+            self._failing.add(port)
+            log.log(level, "port_open_failed port=%s errors=%d retry_s=%g error=%r",
+                    port.port, port.errors, self.reopen_delay, str(e))
+            self.loop.call_later(self.reopen_delay, self._open, port)
+
+    def _fail(self, port, error):
+        log.warning("port_error port=%s retry_s=%g error=%r", port.port, self.reopen_delay, str(error))
+        self.loop.remove_reader(port.fileno())
+        port.close()
+        port.errors += 1
+        self.loop.call_later(self.reopen_delay, self._open, port)
+
+    def _on_readable(self, port):
+        try:
+            block = port.read_block()
+        except (SerialException, OSError) as e:
+            self._fail(port, e)
+            return
+        if block:
+            batch = self.apply(port, block)
+            if batch:
+                self._publish(batch)
+
+    def _publish(self, batch):
+        for name, queue, _ in self._queues:
+            try:
+                queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                self.dropped[name] += 1
+
+    async def _consume(self, name: str, queue: asyncio.Queue, handler):
+        while True:
+            await self._handle(name, handler, await queue.get())
+
+    async def _handle(self, name: str, handler, batch):
+        try:
+            await handler(batch)
+        except Exception as e:
+            log.exception("subscriber_failed name=%s error=%r", name, e)
@@ -0,0 +1,81 @@
+"""
+One serial gateway port.
+
+A SerialPort is opened non-blocking and exposes its file descriptor, so
+the IngestEngine (serial_engine.py) can watch several of them from one
+event loop and a read never waits on one port while another has frames
+pending. Each port keeps its own partial-frame buffer, frame parser and
+counters. A raw port hands over whatever arrived and leaves the framing
+to its parser (binary_frames.py), an ASCII port only complete lines.
+"""
+
+from __future__ import annotations
+
+import time
+
+import serial
+from serial.serialutil import SerialException
+
+
+class SerialPort:
+    def __init__(self, port: str, baud: int, raw: bool = False):
+        self.port = port
+        self.baud = baud
+        self.raw = raw
+        self.ser = None
+        self.buf = bytearray()
+        self.parser = None
+        self.bytes = 0
+        self.blocks = 0
+        self.errors = 0
+        self.opened = 0
+        self.last_rx = 0.0
+
+    def __repr__(self):
+        return "{0}@{1}{2}".format(self.port, self.baud, "/raw" if self.raw else "")
+
+    def open(self):
+        self.ser = serial.Serial(port=self.port, baudrate=self.baud, timeout=0)
+        self.buf.clear()
+        self.opened += 1
+
+    def close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except (SerialException, OSError):
+                pass
+            self.ser = None
+
+    def fileno(self) -> int:
+        return self.ser.fileno()
+
+    def read_block(self) -> bytes:
+        """Drain what the port has and return the complete lines (raw: all of it), never blocks"""
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if not data:
+            return b''
+        self.bytes += len(data)
+        self.last_rx = time.monotonic()
+        if self.raw:
+            self.blocks += 1
+            return data
+        buf = self.buf
+        buf += data
+        end = buf.rfind(b'\n')
+        if end < 0:
+            return b''
+        block = bytes(buf[:end + 1])
+        del buf[:end + 1]
+        self.blocks += 1
+        return block
+
+    def counters(self) -> dict:
+        counters = {'port': self.port, 'baud': self.baud, 'open': self.ser is not None,
+                    'bytes': self.bytes, 'blocks': self.blocks, 'errors': self.errors,
+                    'opened': self.opened}
+        if self.parser is not None:
+            counters['frames'] = self.parser.frames
+            counters['rejected'] = dict(self.parser.rejected)
+        return counters
+
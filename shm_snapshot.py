@@ -0,0 +1,228 @@
+"""
+Sensor table snapshot in shared memory.
+
+The headless ingest daemon owns the segment and publishes into it, any
+number of local viewers (the Tk dashboard with --attach, snapshot-view.py)
+map it read-only and copy consistent snapshots out of it without asking
+the daemon anything.
+
+Layout, all little-endian:
+
+    header    magic b'VAC2', capacity, count, catalog length u32,
+              seq u64, catalog generation u64, instance u64,
+              writer pid u32, publish interval ms u32
+    records   capacity x (value, min, max, updated f64, status, active u8)
+    catalog   JSON [[tag, location, type, derived], ...] in id order
+
+Only the records change with every reading. The catalog (the strings)
+is rewritten when sensors are added, removed or redefined and gets a new
+generation, so viewers only parse it again after a reload.
+
+Consistency is a seqlock: the writer makes seq odd, writes, and makes it
+even again. A reader copies the bytes and retries if seq was odd or moved
+while it copied. The writer never waits for readers.
+
+The daemon publishes on every tick, changed or not, so seq doubles as a
+heartbeat: a reader that has not seen it move for STALE_INTERVALS
+publish intervals (at least STALE_MIN_S) reports stale(). A restarted
+daemon creates a new segment under the same name with a new instance;
+the old mapping stays readable but frozen, so a stale reader looks for
+it with replacement().
+
+A writer that finds the name taken reads the pid in the header and
+refuses to start while that process is alive. Only a segment left
+behind by a dead daemon is unlinked and created again.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+MAGIC = b'VAC2'
+HEADER = struct.Struct('<4sIIIQQQII')
+RECORD = struct.Struct('<ddddBB6x')
+SEQ_OFFSET = 16
+SEQ = struct.Struct('<Q')
+
+DEFAULT_CAPACITY = 4096
+DEFAULT_CATALOG_BYTES = 512 * 1024
+STALE_INTERVALS = 5
+STALE_MIN_S = 3.0
+
+
+def _alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True         # alive, someone else's
+    return True
+
+
+class SnapshotWriter:
+    def __init__(self, name: str, capacity: int = DEFAULT_CAPACITY,
+                 catalog_bytes: int = DEFAULT_CATALOG_BYTES, interval: float = 1.0):
+        """interval is how often publish() will be called, seconds"""
+        self.name = name
+        self.capacity = capacity
+        self.catalog_offset = HEADER.size + capacity * RECORD.size
+        size = self.catalog_offset + catalog_bytes
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._remove_stale(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.seq = 0
+        self.generation = 0
+        self.count = 0
+        self.catalog_len = 0
+        self.instance = time.time_ns()
+        self.pid = os.getpid()
+        self.interval_ms = max(1, int(interval * 1000))
+        self._write_header()
+
+    @staticmethod
+    def _remove_stale(name: str):
+        """Unlink a segment left behind by a daemon that did not shut down, raise FileExistsError if it is in use"""
+        old = shared_memory.SharedMemory(name=name)
+        header = HEADER.unpack_from(old.buf, 0) if old.size >= HEADER.size else (None,)
+        old.close()
+        if header[0] != MAGIC:
+            reason = "exists and is not a sensor snapshot"
+        elif _alive(header[7]):
+            reason = "is in use by pid {0}".format(header[7])
+        else:
+            old.unlink()
+            return
+        # Not ours: keep the resource tracker from unlinking it when we exit
+        resource_tracker.unregister(old._name, 'shared_memory')
+        raise FileExistsError("shared memory {0} {1}".format(name, reason))
+
+    def _write_header(self):
+        HEADER.pack_into(self.buf, 0, MAGIC, self.capacity, self.count, self.catalog_len,
+                         self.seq, self.generation, self.instance, self.pid, self.interval_ms)
+
+    def publish(self, sensors, status, ids, catalog: bool = False):
+        """
+        Write the records of ids, and the catalog when catalog is True.
+        Called with the sensor table locked.
+        """
+        count = min(len(sensors), self.capacity)
+        if catalog:
+            data = json.dumps([[sensors.tags[tid], sensors.locations[tid], sensors.types[tid],
+                                sensors.derived[tid]] for tid in range(count)]).encode()
+            if len(data) > len(self.buf) - self.catalog_offset:
+                raise ValueError("catalog of {0} bytes does not fit the segment".format(len(data)))
+            ids = range(count)
+        buf = self.buf
+        self.seq += 1
+        SEQ.pack_into(buf, SEQ_OFFSET, self.seq)
+        for tid in ids:
+            if tid < count:
+                RECORD.pack_into(buf, HEADER.size + tid * RECORD.size, sensors.values[tid],
+                                 sensors.mins[tid], sensors.maxs[tid], sensors.updated[tid],
+                                 status[tid], sensors.active[tid])
+        if catalog:
+            buf[self.catalog_offset:self.catalog_offset + len(data)] = data
+            self.catalog_len = len(data)
+            self.generation += 1
+        self.count = count
+        self._write_header()
+        # seq goes even last, after everything it covers is in place
+        self.seq += 1
+        SEQ.pack_into(buf, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class Snapshot:
+    __slots__ = ('seq', 'generation', 'catalog', 'records')
+
+    def __init__(self, seq, generation, catalog, records):
+        self.seq = seq
+        self.generation = generation
+        self.catalog = catalog      # [[tag, location, type, derived]] by id
+        self.records = records      # [(value, min, max, updated, status, active)] by id
+
+
+class SnapshotReader:
+    def __init__(self, name: str):
+        self.name = name
+        self.shm = shared_memory.SharedMemory(name=name)
+        # Python < 3.13 would unlink the daemon's segment when a viewer exits
+        resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.buf = self.shm.buf
+        header = HEADER.unpack_from(self.buf, 0)
+        if header[0] != MAGIC:
+            self.close()
+            raise ValueError("{0} is not a sensor snapshot segment".format(name))
+        self.capacity = header[1]
+        self.instance, self.pid, interval_ms = header[6:]
+        self.timeout = max(STALE_INTERVALS * interval_ms / 1000.0, STALE_MIN_S)
+        self.catalog_offset = HEADER.size + self.capacity * RECORD.size
+        self.generation = None
+        self.catalog = []
+        self.retries = 0
+        self.seq = None
+        self.moved = time.monotonic()     # when seq last changed
+
+    def idle(self) -> float:
+        """Seconds since seq last moved"""
+        seq = SEQ.unpack_from(self.buf, SEQ_OFFSET)[0]
+        if seq != self.seq:
+            self.seq = seq
+            self.moved = time.monotonic()
+        return time.monotonic() - self.moved
+
+    def stale(self) -> bool:
+        """True when the writer has not published for longer than its interval allows"""
+        return self.idle() > self.timeout
+
+    def replacement(self):
+        """A reader of the segment now under this name if a new writer created it, else None"""
+        try:
+            reader = SnapshotReader(self.name)
+        except (FileNotFoundError, ValueError):
+            return None
+        if reader.instance == self.instance:
+            reader.close()
+            return None
+        return reader
+
+    def read(self, since: int = None, retries: int = 1000):
+        """Return a consistent Snapshot, None if seq is still since"""
+        buf = self.buf
+        for _ in range(retries):
+            _, _, count, catalog_len, seq, generation = HEADER.unpack_from(buf, 0)[:6]
+            if seq == since:
+                return None
+            if seq & 1:
+                self.retries += 1
+                time.sleep(0)
+                continue
+            records = bytes(buf[HEADER.size:HEADER.size + count * RECORD.size])
+            if generation != self.generation:
+                catalog = bytes(buf[self.catalog_offset:self.catalog_offset + catalog_len])
+            if SEQ.unpack_from(buf, SEQ_OFFSET)[0] != seq:
+                self.retries += 1
+                continue
+            if generation != self.generation:
+                self.catalog = json.loads(catalog) if catalog_len else []
+                self.generation = generation
+            return Snapshot(seq, generation, self.catalog, list(RECORD.iter_unpack(records)))
+        raise TimeoutError("no consistent snapshot after {0} tries".format(retries))
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Print the sensor table published by a headless control room daemon.
+
+  python3 T2511_VA_ControlRoom1.py --headless --port /dev/ttyUSB0
+  python3 snapshot-view.py                 # once
+  python3 snapshot-view.py --interval 2    # follow, a new table when anything changed
+
+Reads the shared-memory segment directly (shm_snapshot.py), so it costs
+the daemon nothing however many copies run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from shm_snapshot import SnapshotReader
+from sensor_status import STATUS_NAMES
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Show the shared-memory sensor snapshot")
+    p.add_argument("--shm", default=os.getenv("SHM_NAME", "va_controlroom"),
+                   help="Shared-memory segment name (default from $SHM_NAME or va_controlroom)")
+    p.add_argument("--interval", "-i", type=float, default=0.0,
+                   help="Check for changes every this many seconds (default: print once)")
+    return p.parse_args()
+
+
+def print_snapshot(snap):
+    print("{0:10s} {1:14s} {2:6s} {3:>8s} {4:>7s} {5:>7s} {6:8s} {7}".format(
+        'Sensor', 'Location', 'Type', 'Value', 'Min', 'Max', 'Status', 'Updated'))
+    for (tag, location, type_, _), record in zip(snap.catalog, snap.records):
+        value, min_value, max_value, updated, status, active = record
+        if not active:
+            continue
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(updated)) if updated else "---"
+        print("{0:10s} {1:14s} {2:6s} {3:8.2f} {4:7.1f} {5:7.1f} {6:8s} {7}".format(
+            tag, location, type_, value, min_value, max_value,
+            STATUS_NAMES.get(status, str(status)), when))
+    print(f"seq {snap.seq} catalog generation {snap.generation}")
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        reader = SnapshotReader(args.shm)
+    except FileNotFoundError:
+        print(f"No snapshot segment {args.shm}, is the daemon running with --headless?")
+        return 1
+    seq = None
+    try:
+        while True:
+            snap = reader.read(seq)
+            if snap is not None:
+                seq = snap.seq
+                print_snapshot(snap)
+            if args.interval <= 0:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Load test for the /events server-sent-events stream.
+
+Without --url it starts its own StatusServer and EventHub on a free port
+and publishes synthetic readings at --rate change sets per second, so
+nothing else has to run. With --url it subscribes to a running control
+room (--http) instead and only measures.
+
+  python3 sse-test1.py                          # 100 subscribers, 10 s
+  python3 sse-test1.py --clients 200 --slow 10 --rate 200
+  python3 sse-test1.py --url http://pi.local:8080/events
+
+--slow clients connect with a tiny receive buffer and never read after
+the headers; they must get dropped by the server's write timeout while
+the publisher and the other clients carry on. At the end one client
+reconnects with its Last-Event-ID and must resume without a snapshot,
+and one with an id from long ago must get a snapshot.
+
+Prints events and snapshots per client, the delay from a reading to its
+arrival, and the slowest publish() call.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from event_stream import EventHub
+from status_http import StatusServer, TableCache, SSE_WRITE_TIMEOUT
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Concurrent /events subscribers")
+    p.add_argument("--url", default="",
+                   help="Subscribe to this running /events URL (default: start a local test server)")
+    p.add_argument("--clients", "-c", type=int, default=100, help="Subscribers (default 100)")
+    p.add_argument("--slow", type=int, default=5, help="Extra subscribers that never read (default 5)")
+    p.add_argument("--sensors", "-n", type=int, default=50, help="Synthetic sensors (default 50)")
+    p.add_argument("--rate", "-r", type=float, default=100.0,
+                   help="Synthetic change sets per second (default 100)")
+    p.add_argument("--duration", "-d", type=float, default=10.0, help="Test length in seconds (default 10)")
+    return p.parse_args()
+
+
+class LocalServer:
+    """StatusServer plus a publisher thread standing in for the serial ingest"""
+
+    def __init__(self, sensors: int, rate: float):
+        self.tags = ["SIM{0:04d}_T".format(i) for i in range(sensors)]
+        self.values = [20.0] * sensors
+        self.version = 0
+        self.rate = rate
+        self.hub = EventHub()
+        self.server = StatusServer(('127.0.0.1', 0), TableCache(lambda: self.version, self.table),
+                                   lambda tag, seconds: None, self.hub)
+        self.url = "http://127.0.0.1:{0}/events".format(self.server.server_address[1])
+        self.publish_max = 0.0
+        self.running = True
+
+    def table(self) -> dict:
+        now = time.time()
+        return {'version': self.version, 'sensors': [
+            {'tag': tag, 'value': value, 'updated': now, 'status': 'OK'}
+            for tag, value in zip(self.tags, self.values)]}
+
+    def publisher(self):
+        i = 0
+        next_t = time.monotonic()
+        while self.running:
+            now = time.time()
+            changes = {}
+            for k in range(5):
+                tid = (i * 5 + k) % len(self.tags)
+                self.values[tid] += 0.1
+                changes[self.tags[tid]] = {'value': round(self.values[tid], 2), 'updated': now, 'status': 'OK'}
+            self.version += 1
+            t0 = time.perf_counter()
+            self.hub.publish(changes)
+            self.publish_max = max(self.publish_max, time.perf_counter() - t0)
+            i += 1
+            next_t += 1.0 / self.rate
+            time.sleep(max(0.0, next_t - time.monotonic()))
+
+    def start(self):
+        self.server.start()
+        threading.Thread(target=self.publisher, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.server.stop()
+
+
+class Subscriber:
+    def __init__(self, url: str, last_id=None, slow: bool = False):
+        self.url = urlsplit(url)
+        self.last_id = last_id
+        self.slow = slow
+        self.events = 0
+        self.snapshots = 0
+        self.delays = []
+        self.first_event = None
+        self.error = None
+        self.stop = False
+
+    def run(self):
+        try:
+            conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=30)
+            if self.slow:
+                conn.sock = socket.create_connection((self.url.hostname, self.url.port or 80))
+                conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            headers = {} if self.last_id is None else {'Last-Event-ID': str(self.last_id)}
+            conn.request('GET', self.url.path or '/events', headers=headers)
+            resp = conn.getresponse()
+            if self.slow:
+                while not self.stop:
+                    time.sleep(0.1)
+                return
+            event, data = None, None
+            while not self.stop:
+                line = resp.fp.readline()
+                if not line:
+                    break
+                line = line.rstrip(b'\r\n')
+                if line.startswith(b'id: '):
+                    self.last_id = int(line[4:])
+                elif line.startswith(b'event: '):
+                    event = line[7:].decode()
+                elif line.startswith(b'data: '):
+                    data = line[6:]
+                elif not line and event:
+                    self.dispatch(event, data)
+                    event, data = None, None
+            conn.close()
+        except OSError as e:
+            self.error = e
+
+    def dispatch(self, event, data):
+        if self.first_event is None:
+            self.first_event = event
+        if event == 'snapshot':
+            self.snapshots += 1
+            return
+        self.events += 1
+        now = time.time()
+        for fields in json.loads(data).values():
+            if fields.get('updated'):
+                self.delays.append(now - fields['updated'])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float('nan')
+
+
+def main() -> int:
+    args = parse_args()
+    local = None
+    url = args.url
+    if not url:
+        local = LocalServer(args.sensors, args.rate)
+        local.start()
+        url = local.url
+    print(f"{args.clients} subscribers + {args.slow} slow ones on {url} for {args.duration:g} s")
+
+    clients = [Subscriber(url).start() for _ in range(args.clients)]
+    slow = [Subscriber(url, slow=True).start() for _ in range(args.slow)]
+    time.sleep(args.duration)
+
+    # Resume with the last id seen, then with one from long ago
+    resume = Subscriber(url, last_id=clients[0].last_id).start()
+    stale = Subscriber(url, last_id=1).start()
+    time.sleep(1.0)
+
+    for c in clients + slow + [resume, stale]:
+        c.stop = True
+    events = [c.events for c in clients]
+    delays = [d for c in clients for d in c.delays]
+    print(f"events per client: min {min(events)} max {max(events)}, "
+          f"snapshots {sum(c.snapshots for c in clients)}, errors {sum(1 for c in clients if c.error)}")
+    print(f"reading -> client delay: median {percentile(delays, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(delays, 0.99) * 1000:.1f} ms")
+    print(f"resume with Last-Event-ID: first event '{resume.first_event}', {resume.events} deltas")
+    print(f"stale Last-Event-ID: first event '{stale.first_event}'")
+    if local is not None:
+        hub = local.hub
+        print(f"published {hub.published} change sets, slowest publish() {local.publish_max * 1e6:.0f} us, "
+              f"server dropped {hub.dropped} subscribers (write timeout {SSE_WRITE_TIMEOUT:g} s)")
+        local.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,243 @@
+"""
+HTTP JSON API for the sensor table.
+
+    GET /sensors                           all active sensors with their status
+    GET /sensors/<tag>/history?seconds=N   in-memory readings of one sensor
+                                           for the last N seconds (default 3600)
+    GET /sensors/<tag>/rollup?res=R&seconds=N
+                                           min/max/mean/count buckets of one
+                                           sensor, R is 1m, 1h or 1d (default
+                                           1h), N defaults to one day
+    GET /events                            server-sent events: a snapshot, then
+                                           only what changed (event_stream.py)
+
+The table is serialized at most once per table version: the application
+bumps a counter whenever a reading, a status change, a threshold edit or
+a reload touches the table, and the cached body is rebuilt only when a
+request sees a newer version than the one it was built for. The ETag is
+that version, so a client sending If-None-Match gets an empty 304 until
+something has changed. Dozens of clients polling every few seconds cost
+one dictionary build per change plus a header exchange each.
+
+Each request is served in its own thread (ThreadingHTTPServer) and never
+touches Tk.
+
+An /events subscriber starts with a "snapshot" event carrying the same
+body as GET /sensors, then gets "delta" events of {tag: {changed fields}}.
+Deltas are sent at most every SSE_MIN_INTERVAL seconds, whatever piled
+up in between coalesced into one. A reconnecting EventSource sends
+Last-Event-ID and resumes from the replay buffer without a snapshot.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from event_stream import merge_events
+
+log = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_SECONDS = 3600.0
+DEFAULT_ROLLUP = '1h'
+DEFAULT_ROLLUP_SECONDS = 86400.0
+SSE_MIN_INTERVAL = 0.25
+SSE_KEEPALIVE = 15.0
+SSE_WRITE_TIMEOUT = 10.0
+# Caps what a stalled client can queue in the kernel, and with it how long
+# it takes to notice that it stalled
+SSE_SEND_BUFFER = 64 * 1024
+
+
+class TableCache:
+    def __init__(self, version, build):
+        """version() returns the current table version, build() the table as a JSON-able object"""
+        self.version = version
+        self.build = build
+        # A restarted server starts its versions from 0 again
+        self.prefix = "{0:x}-{1:x}".format(os.getpid(), int(time.time()))
+        self.lock = threading.Lock()
+        self.built = None
+        self.cached = (None, b'')   # (etag, body), replaced as one so readers never mix them
+        self.builds = 0
+
+    def get(self):
+        """Return (etag, body) for the current version, serialized once per version"""
+        version = self.version()
+        if version != self.built:
+            with self.lock:
+                if version != self.built:
+                    body = json.dumps(self.build(), separators=(',', ':')).encode()
+                    self.cached = ('"{0}-{1}"'.format(self.prefix, version), body)
+                    self.built = version
+                    self.builds += 1
+        return self.cached
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    server_version = "VAControlRoom/1.0"
+    # Keep-alive, pollers reuse their connection. Headers and body go out
+    # in separate writes, without TCP_NODELAY each response waits for a
+    # delayed ACK.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        log.debug("http_request client=%s %s", self.client_address[0], format % args)
+
+    def _send(self, code: int, body: bytes = b'', etag: str = None):
+        self.send_response(code)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if code != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if code != 304:
+            self.wfile.write(body)
+
+    def _error(self, code: int, message: str):
+        self._send(code, json.dumps({'error': message}).encode())
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        if parts == ['sensors']:
+            etag, body = self.server.cache.get()
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(',')]:
+                self._send(304, etag=etag)
+            else:
+                self._send(200, body, etag)
+        elif len(parts) == 3 and parts[0] == 'sensors' and parts[2] == 'history':
+            seconds = self._seconds(parse_qs(url.query), DEFAULT_HISTORY_SECONDS)
+            if seconds is None:
+                return
+            times_values = self.server.history(parts[1], seconds)
+            if times_values is None:
+                self._error(404, "unknown sensor {0}".format(parts[1]))
+                return
+            times, values = times_values
+            self._send(200, json.dumps({'tag': parts[1], 'seconds': seconds,
+                                        'times': times.tolist(), 'values': values.tolist()},
+                                       separators=(',', ':')).encode())
+        elif len(parts) == 3 and parts[0] == 'sensors' and parts[2] == 'rollup' and self.server.rollup:
+            self._rollup(parts[1], parse_qs(url.query))
+        elif parts == ['events'] and self.server.hub is not None:
+            self._events(parse_qs(url.query))
+        else:
+            self._error(404, "not found")
+
+    def _seconds(self, query, default: float):
+        """The seconds parameter, None after a 400 if it is not a finite number >= 0"""
+        try:
+            seconds = float(query.get('seconds', [default])[0])
+        except ValueError:
+            seconds = None
+        if seconds is None or not (math.isfinite(seconds) and seconds >= 0):
+            self._error(400, "seconds must be a number >= 0")
+            return None
+        return seconds
+
+    def _rollup(self, tag: str, query):
+        resolution = query.get('res', [DEFAULT_ROLLUP])[0]
+        if resolution not in self.server.resolutions:
+            self._error(400, "res must be one of {0}".format(", ".join(self.server.resolutions)))
+            return
+        seconds = self._seconds(query, DEFAULT_ROLLUP_SECONDS)
+        if seconds is None:
+            return
+        rows = self.server.rollup(tag, resolution, seconds)
+        if rows is None:
+            self._error(404, "unknown sensor {0}".format(tag))
+            return
+        self._send(200, json.dumps({'tag': tag, 'res': resolution, 'seconds': seconds,
+                                    'fields': ['start', 'min', 'max', 'mean', 'count'], 'buckets': rows},
+                                   separators=(',', ':')).encode())
+
+    def _write_event(self, event: str, event_id: int, data: bytes):
+        self.wfile.write(b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event.encode(), data))
+
+    def _snapshot(self, hub) -> int:
+        # Events after this id are sent next, the snapshot may already
+        # contain some of them, which is harmless
+        event_id = hub.last_id
+        self._write_event("snapshot", event_id, self.server.cache.get()[1])
+        hub.snapshots += 1
+        return event_id
+
+    def _events(self, query):
+        hub = self.server.hub
+        cursor = self.headers.get("Last-Event-ID") or query.get('last_id', [None])[0]
+        try:
+            cursor = int(cursor) if cursor is not None else None
+        except ValueError:
+            cursor = None
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self.connection.settimeout(SSE_WRITE_TIMEOUT)
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SSE_SEND_BUFFER)
+        with hub.cond:
+            hub.subscribers += 1
+        try:
+            if cursor is None:
+                cursor = self._snapshot(hub)
+            while not hub.closed:
+                event_id, events = hub.since(cursor, SSE_KEEPALIVE)
+                if events is None:
+                    cursor = self._snapshot(hub)
+                elif events:
+                    self._write_event("delta", events[-1][0],
+                                      json.dumps(merge_events(events), separators=(',', ':')).encode())
+                    cursor = events[-1][0]
+                else:
+                    self.wfile.write(b": keepalive\n\n")
+                time.sleep(SSE_MIN_INTERVAL)
+        except (OSError, socket.timeout) as e:
+            # Gone, or too slow to take a write within the timeout
+            with hub.cond:
+                hub.dropped += 1
+            log.debug("sse_drop client=%s error=%r", self.client_address[0], e)
+        finally:
+            with hub.cond:
+                hub.subscribers -= 1
+
+
+class StatusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache: TableCache, history, hub=None, rollup=None, resolutions=()):
+        """
+        history(tag, seconds) returns (times, values) arrays, None for an
+        unknown tag. hub is the EventHub behind /events, None disables it.
+        rollup(tag, resolution, seconds) returns the bucket rows of one of
+        resolutions, None for an unknown tag; None disables /rollup.
+        """
+        super().__init__(address, StatusHandler)
+        self.cache = cache
+        self.history = history
+        self.hub = hub
+        self.rollup = rollup
+        self.resolutions = tuple(resolutions)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="http", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.hub is not None:
+            self.hub.close()
+        self.shutdown()
+        self.server_close()
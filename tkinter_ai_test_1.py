@@ -3,6 +3,17 @@ Simple Tkinter UI that displays several text fields which can be updated
 by incoming data. Includes a simulator that pushes updates into a queue and
 an optional serial-send feature for a Raspberry Pi using pyserial.
 
+Incoming updates go through UpdateChannel, which keeps only the newest
+value per field between frames. The Tk thread drains it on an adaptive
+cadence: every FRAME_MIN_MS while data arrives, backing off to
+FRAME_IDLE_MS when idle, and never spending more than about half of the
+frame applying updates. Use the simulation rate field to try a fast
+producer (1000 msg/s and up).
+
+Outgoing serial lines go through SerialWriter, a background thread with a
+bounded queue, so the Tk thread never opens or writes the port itself. Its
+state and counters are shown under the controls.
+
 Run:
 	python3 tkinter_ai_test_1.py
 
@@ -14,11 +25,11 @@ setup (for example `/dev/serial0` or `/dev/ttyUSB0`).
 """
 
 import threading
-import queue
 import time
 import random
 import json
 import tkinter as tk
+from collections import OrderedDict
 from tkinter import ttk
 
 try:
@@ -28,7 +39,206 @@ except Exception:
 	SERIAL_AVAILABLE = False
 
 
+class SerialWriter:
+	"""
+	Background writer for the outgoing serial lines.
+
+	The Tk thread only calls send(), which appends to a bounded queue and
+	returns. A worker thread opens the port, joins everything queued into
+	one write and reopens the port with exponential backoff after a
+	failure, so a slow, blocked or unplugged UART never stalls the UI.
+
+	A payload sent with a key replaces a still-queued payload with the
+	same key (a newer field update supersedes the older one); payloads
+	without a key are always sent. When the queue is full the oldest
+	payload is dropped.
+	"""
+
+	def __init__(self, max_queue=256, batch_bytes=4096, write_timeout=2.0,
+				 reopen_min=0.5, reopen_max=30.0):
+		self.max_queue = max_queue
+		self.batch_bytes = batch_bytes
+		self.write_timeout = write_timeout
+		self.reopen_min = reopen_min
+		self.reopen_max = reopen_max
+		self.cond = threading.Condition()
+		self.pending = OrderedDict()    # key -> bytes, in send order
+		self.port = None
+		self.baud = None
+		self.handle = None
+		self.running = True
+		self.seq = 0
+		self.sent = 0
+		self.batches = 0
+		self.coalesced = 0
+		self.dropped = 0
+		self.failed = 0
+		self.errors = 0
+		self.last_error = ""
+		self.thread = threading.Thread(target=self._run, daemon=True)
+		self.thread.start()
+
+	def configure(self, port, baud):
+		"""Set the port from the Tk thread, a change reopens it"""
+		with self.cond:
+			if (port, baud) != (self.port, self.baud):
+				self.port, self.baud = port, baud
+				self._close_handle()
+				self.cond.notify()
+
+	def send(self, payload, key=None):
+		"""Queue one line (bytes, newline included), never blocks"""
+		with self.cond:
+			if key is None:
+				self.seq += 1
+				key = ("seq", self.seq)
+			elif key in self.pending:
+				del self.pending[key]
+				self.coalesced += 1
+			self.pending[key] = payload
+			while len(self.pending) > self.max_queue:
+				self.pending.popitem(last=False)
+				self.dropped += 1
+			self.cond.notify()
+
+	def stats(self):
+		with self.cond:
+			return {
+				"state": "open" if self.handle is not None else "closed",
+				"queued": len(self.pending),
+				"sent": self.sent,
+				"batches": self.batches,
+				"coalesced": self.coalesced,
+				"dropped": self.dropped,
+				"failed": self.failed,
+				"errors": self.errors,
+				"last_error": self.last_error,
+			}
+
+	def close(self):
+		with self.cond:
+			self.running = False
+			self.cond.notify()
+		self.thread.join(timeout=self.write_timeout + 1.0)
+		with self.cond:
+			self._close_handle()
+
+	def _close_handle(self):
+		if self.handle is not None:
+			try:
+				self.handle.close()
+			except Exception:
+				pass
+			self.handle = None
+
+	def _take_batch(self):
+		"""Pop queued payloads up to batch_bytes, condition held"""
+		parts = []
+		size = 0
+		while self.pending and (not parts or size + len(next(iter(self.pending.values()))) <= self.batch_bytes):
+			payload = self.pending.popitem(last=False)[1]
+			parts.append(payload)
+			size += len(payload)
+		return parts
+
+	def _run(self):
+		backoff = self.reopen_min
+		while True:
+			with self.cond:
+				while self.running and not (self.pending and self.port):
+					self.cond.wait()
+				if not self.running:
+					return
+				handle = self.handle
+				port, baud = self.port, self.baud
+			if handle is None:
+				try:
+					handle = serial.Serial(port, baud, timeout=1, write_timeout=self.write_timeout)
+				except Exception as exc:
+					with self.cond:
+						self.errors += 1
+						self.last_error = str(exc)
+						# Wait before the next attempt, close() or a new port wakes us
+						self.cond.wait(backoff)
+					backoff = min(backoff * 2, self.reopen_max)
+					continue
+				with self.cond:
+					if (port, baud) != (self.port, self.baud):
+						handle.close()
+						continue
+					self.handle = handle
+				backoff = self.reopen_min
+			with self.cond:
+				parts = self._take_batch()
+			try:
+				handle.write(b"".join(parts))
+			except Exception as exc:
+				with self.cond:
+					self.failed += len(parts)
+					self.errors += 1
+					self.last_error = str(exc)
+					if self.handle is handle:
+						self._close_handle()
+				continue
+			with self.cond:
+				self.sent += len(parts)
+				self.batches += 1
+
+
+class UpdateChannel:
+	"""
+	Latest-value mailbox between producer threads and the Tk thread.
+
+	put() merges an update into one dict of field -> newest value, so a
+	value that is superseded before the next frame is never applied and
+	the Tk thread does one drain per frame however fast the producer
+	runs. Memory is bounded by max_fields: an update to a field already
+	pending always replaces it (counted as coalesced), a new field that
+	does not fit is dropped (counted as dropped).
+	"""
+
+	def __init__(self, max_fields=64):
+		self.max_fields = max_fields
+		self.lock = threading.Lock()
+		self.latest = {}
+		self.received = 0
+		self.coalesced = 0
+		self.dropped = 0
+
+	def put(self, data):
+		# data can be dict or JSON string, parsed here in the producer thread
+		if isinstance(data, str):
+			try:
+				data = json.loads(data)
+			except Exception:
+				data = {"Message": data}
+		with self.lock:
+			self.received += 1
+			latest = self.latest
+			for key, value in data.items():
+				if key in latest:
+					self.coalesced += 1
+				elif len(latest) >= self.max_fields:
+					self.dropped += 1
+					continue
+				latest[key] = value
+
+	def drain(self):
+		"""Return and clear the pending {field: value}"""
+		with self.lock:
+			latest, self.latest = self.latest, {}
+		return latest
+
+	def stats(self):
+		with self.lock:
+			return {"received": self.received, "coalesced": self.coalesced,
+					"dropped": self.dropped, "pending": len(self.latest)}
+
+
 class TkDataPanel:
+	FRAME_MIN_MS = 33       # about 30 frames/s while updates arrive
+	FRAME_IDLE_MS = 250
+
 	def __init__(self, root):
 		self.root = root
 		root.title("Data Panel")
@@ -75,13 +285,30 @@ class TkDataPanel:
 		send_now = ttk.Button(controls, text="Send Current over Serial", command=self.send_current_over_serial)
 		send_now.grid(column=0, row=3, columnspan=2, sticky=(tk.W, tk.E), pady=(6, 0))
 
-		# Queue and threading
-		self.incoming_queue = queue.Queue()
+		self.serial_status_var = tk.StringVar(value="Serial: idle")
+		ttk.Label(controls, textvariable=self.serial_status_var).grid(column=0, row=4, columnspan=2, sticky=tk.W, pady=(6, 0))
+
+		ttk.Label(controls, text="Sim rate (msg/s):").grid(column=0, row=5, sticky=tk.W, pady=4)
+		self.sim_rate_var = tk.StringVar(value="1")
+		ttk.Entry(controls, textvariable=self.sim_rate_var, width=18).grid(column=1, row=5, sticky=tk.W)
+		self.sim_rate_var.trace_add("write", self._on_sim_rate)
+
+		self.channel_status_var = tk.StringVar(value="Updates: -")
+		ttk.Label(controls, textvariable=self.channel_status_var).grid(column=0, row=6, columnspan=2, sticky=tk.W)
+
+		# Update channel and threading
+		self.incoming_queue = UpdateChannel()
 		self._sim_thread = None
+		self._sim_rate = 1.0
 		self._stop_event = threading.Event()
+		self._frame_ms = self.FRAME_IDLE_MS
+		self._shown = {}
+		self._frames = 0
+		self._stats_at = time.monotonic()
+		self._stats_last = (0, 0)
 
-		# Serial handle
-		self.serial_handle = None
+		# Outgoing serial data, written by its own thread
+		self.serial_writer = SerialWriter() if SERIAL_AVAILABLE else None
 
 		# Start periodic queue processing
 		self.root.after(100, self._process_queue)
@@ -101,7 +328,14 @@ class TkDataPanel:
 			self.sim_button.config(text="Start Simulation")
 			self._stop_event.set()
 
+	def _on_sim_rate(self, *args):
+		try:
+			self._sim_rate = max(0.1, float(self.sim_rate_var.get()))
+		except ValueError:
+			pass
+
 	def _simulation_producer(self):
+		next_t = time.monotonic()
 		while not self._stop_event.is_set():
 			data = {
 				"Temperature (C)": round(random.uniform(15.0, 30.0), 1),
@@ -112,17 +346,54 @@ class TkDataPanel:
 			}
 			# Put JSON string to simulate incoming payloads, or raw dict
 			self.incoming_queue.put(data)
-			time.sleep(1.0)
+			next_t += 1.0 / self._sim_rate
+			delay = next_t - time.monotonic()
+			if delay > 0:
+				self._stop_event.wait(delay)
+			elif delay < -1.0:
+				# Fell behind by more than a second, do not burst to catch up
+				next_t = time.monotonic()
 
 	def _process_queue(self):
+		start = time.perf_counter()
+		data = {}
 		try:
-			while True:
-				item = self.incoming_queue.get_nowait()
-				self.update_fields(item)
-		except queue.Empty:
-			pass
+			data = self.incoming_queue.drain()
+			if data:
+				self.update_fields(data)
+				self._frames += 1
+			self._show_serial_status()
+			self._show_channel_status()
 		finally:
-			self.root.after(100, self._process_queue)
+			busy_ms = (time.perf_counter() - start) * 1000.0
+			if data:
+				self._frame_ms = max(self.FRAME_MIN_MS, int(2 * busy_ms))
+			else:
+				self._frame_ms = min(self.FRAME_IDLE_MS, self._frame_ms * 2)
+			self.root.after(self._frame_ms, self._process_queue)
+
+	def _show_channel_status(self):
+		now = time.monotonic()
+		elapsed = now - self._stats_at
+		if elapsed < 1.0:
+			return
+		st = self.incoming_queue.stats()
+		received, frames = self._stats_last
+		self.channel_status_var.set("Updates: {0:.0f} msg/s in, {1:.0f} frames/s, coalesced {2}, dropped {3}, frame {4} ms".format(
+			(st["received"] - received) / elapsed, (self._frames - frames) / elapsed,
+			st["coalesced"], st["dropped"], self._frame_ms))
+		self._stats_at = now
+		self._stats_last = (st["received"], self._frames)
+
+	def _show_serial_status(self):
+		if self.serial_writer is None:
+			return
+		st = self.serial_writer.stats()
+		text = "Serial: {state}, queue {queued}, sent {sent} in {batches} writes, coalesced {coalesced}, dropped {dropped}, failed {failed}, errors {errors}".format(**st)
+		if st["errors"] and st["state"] == "closed":
+			text += "\nLast error: " + st["last_error"]
+		if self.serial_status_var.get() != text:
+			self.serial_status_var.set(text)
 
 	def update_fields(self, data):
 		# data can be dict or JSON string
@@ -134,54 +405,44 @@ class TkDataPanel:
 
 		for key, value in data.items():
 			if key in self.vars:
-				self.vars[key].set(str(value))
-
-		# Optionally send to serial
+				text = str(value)
+				if self._shown.get(key) != text:
+					self._shown[key] = text
+					self.vars[key].set(text)
+
+		# Optionally send to serial. Updates carry only the changed fields,
+		# so a newer one replaces a still-queued one with the same fields
+		# only; {"Temperature": ...} is not lost to a later {"Humidity": ...}
 		if self.serial_enabled.get():
 			payload = json.dumps(data)
-			self._serial_send(payload)
-
-	def _open_serial(self):
-		if not SERIAL_AVAILABLE:
-			return None
-		if self.serial_handle is None:
-			try:
-				self.serial_handle = serial.Serial(self.serial_port_var.get(), self.serial_baud_var.get(), timeout=1)
-			except Exception as exc:
-				print(f"Failed to open serial port: {exc}")
-				self.serial_handle = None
-		return self.serial_handle
+			self._serial_send(payload, key=("fields", frozenset(data)))
 
-	def _serial_send(self, text):
+	def _serial_send(self, text, key=None):
 		if not SERIAL_AVAILABLE:
 			print("pyserial not installed; cannot send to serial.")
 			return
-		handle = self._open_serial()
-		if handle is None:
-			return
 		try:
-			if isinstance(text, str):
-				to_write = (text + "\n").encode("utf-8")
-			else:
-				to_write = (json.dumps(text) + "\n").encode("utf-8")
-			handle.write(to_write)
-		except Exception as exc:
-			print(f"Serial write failed: {exc}")
+			self.serial_writer.configure(self.serial_port_var.get(), self.serial_baud_var.get())
+		except tk.TclError as exc:
+			print(f"Invalid serial settings: {exc}")
+			return
+		if isinstance(text, str):
+			to_write = (text + "\n").encode("utf-8")
+		else:
+			to_write = (json.dumps(text) + "\n").encode("utf-8")
+		self.serial_writer.send(to_write, key)
 
 	def send_current_over_serial(self):
 		data = {k: self.vars[k].get() for k in self.fields}
-		self._serial_send(json.dumps(data))
+		self._serial_send(json.dumps(data), key="current")
 
 	def _on_close(self):
 		self._stop_event.set()
 		# Give threads a moment to stop
 		if self._sim_thread is not None:
 			self._sim_thread.join(timeout=1.0)
-		if self.serial_handle is not None:
-			try:
-				self.serial_handle.close()
-			except Exception:
-				pass
+		if self.serial_writer is not None:
+			self.serial_writer.close()
 		self.root.destroy()
 
 
@@ -0,0 +1,232 @@
+"""
+Trend graph window for one sensor.
+
+The samples of the selected time range are reduced to one (min, max) pair
+per pixel column before anything is drawn, and each column is a single
+vertical canvas line. Drawing a year therefore costs the same number of
+canvas items as drawing an hour. The reduction bisects the sorted
+timestamps per column and takes min()/max() of array slices, so it
+never loops over the samples in Python.
+
+The query for a range and its reduction run in a worker thread, as a
+year of history on disk takes seconds to read; the Tk thread only
+checks every FETCH_POLL_MS whether the columns are ready and draws
+them. Picking another range while one loads discards the older result.
+
+While the window is open it polls the in-memory history once a second
+and only touches the columns that got new samples. When time moves on
+by whole pixels, the plot is shifted with canvas.move() instead of being
+redrawn, and a sample outside the value axis rescales the columns
+already held without querying again.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import tkinter as tk
+from bisect import bisect_left
+
+log = logging.getLogger(__name__)
+
+RANGES = (
+    ('1 h', 3600),
+    ('24 h', 86400),
+    ('7 d', 7 * 86400),
+    ('30 d', 30 * 86400),
+    ('1 y', 365 * 86400),
+)
+
+PLOT_WIDTH = 600
+PLOT_HEIGHT = 300
+MARGIN_LEFT = 50
+MARGIN_TOP = 10
+POLL_MS = 1000
+FETCH_POLL_MS = 50
+
+
+def decimate(times, values, t0: float, t1: float, width: int):
+    """Return per-pixel (mins, maxs) lists for t0 <= ts < t1, None where a column is empty"""
+    mins = [None] * width
+    maxs = [None] * width
+    if not times:
+        return mins, maxs
+    step = (t1 - t0) / width
+    lo = bisect_left(times, t0)
+    for x in range(width):
+        hi = bisect_left(times, t0 + (x + 1) * step, lo)
+        if hi > lo:
+            chunk = values[lo:hi]
+            mins[x] = min(chunk)
+            maxs[x] = max(chunk)
+        lo = hi
+    return mins, maxs
+
+
+class TrendWindow:
+    def __init__(self, root, sensors, tid, query, recent):
+        """
+        query(tid, t0, t1) returns (times, values) for any range and is
+        called from a worker thread, recent(tid, t0) the in-memory samples
+        with ts >= t0.
+        """
+        self.sensors = sensors
+        self.tid = tid
+        self.query = query
+        self.recent = recent
+        self.span = RANGES[0][1]
+
+        self.win = tk.Toplevel(root)
+        self.win.title("Trend: {0} {1}".format(sensors.tags[tid], sensors.locations[tid]))
+        self.canvas = tk.Canvas(self.win, width=MARGIN_LEFT + PLOT_WIDTH + 10,
+                                height=MARGIN_TOP + PLOT_HEIGHT + 30, bg='white')
+        self.canvas.grid(row=0, column=0, columnspan=len(RANGES))
+        for i, (name, span) in enumerate(RANGES):
+            btn = tk.Button(self.win, text=name, command=lambda span=span: self.set_span(span))
+            btn.grid(row=1, column=i, pady=5)
+
+        self.items = [None] * PLOT_WIDTH
+        self.fetches = 0
+        self.fetched = None         # (fetch number, last ts, mins, maxs) from the worker
+        self.loading = False
+        self._poll_id = None
+        self._fetch_id = None
+        self.win.protocol("WM_DELETE_WINDOW", self.close)
+        self.redraw()
+        self._poll_id = self.win.after(POLL_MS, self.poll)
+
+    def set_span(self, span):
+        self.span = span
+        self.redraw()
+
+    def close(self):
+        for after_id in (self._poll_id, self._fetch_id):
+            if after_id is not None:
+                self.win.after_cancel(after_id)
+        self.win.destroy()
+
+    def _y(self, value: float) -> float:
+        return MARGIN_TOP + (self.vmax - value) * PLOT_HEIGHT / (self.vmax - self.vmin)
+
+    def redraw(self):
+        """Load the current span in a worker thread, the plot is rebuilt when it is ready"""
+        self.t1 = time.time()
+        self.t0 = self.t1 - self.span
+        self.step = self.span / PLOT_WIDTH
+        self.fetches += 1
+        self.loading = True
+        self.canvas.delete('all')
+        self.items = [None] * PLOT_WIDTH
+        self.canvas.create_text(MARGIN_LEFT + PLOT_WIDTH // 2, MARGIN_TOP + PLOT_HEIGHT // 2,
+                                text="Loading...", font=('Arial', 10), fill='grey')
+        threading.Thread(target=self._fetch, args=(self.fetches, self.t0, self.t1),
+                         name="trend", daemon=True).start()
+        if self._fetch_id is None:
+            self._fetch_id = self.win.after(FETCH_POLL_MS, self._check_fetch)
+
+    def _fetch(self, number: int, t0: float, t1: float):
+        """Worker thread: query and reduce one span, never touches Tk"""
+        try:
+            times, values = self.query(self.tid, t0, t1)
+        except Exception as e:
+            log.exception("trend_query_failed tag=%s error=%r", self.sensors.tags[self.tid], e)
+            times, values = (), ()
+        mins, maxs = decimate(times, values, t0, t1, PLOT_WIDTH)
+        self.fetched = (number, times[-1] if times else t0, mins, maxs)
+
+    def _check_fetch(self):
+        fetched = self.fetched
+        if fetched is not None and fetched[0] == self.fetches:
+            self.fetched = None
+            self._fetch_id = None
+            self.loading = False
+            _, self.last_ts, self.mins, self.maxs = fetched
+            self._paint()
+        else:
+            self._fetch_id = self.win.after(FETCH_POLL_MS, self._check_fetch)
+
+    def _paint(self):
+        """Rebuild the whole plot from the columns held"""
+        limits = [self.sensors.mins[self.tid], self.sensors.maxs[self.tid]]
+        limits += [v for v in self.mins if v is not None]
+        limits += [v for v in self.maxs if v is not None]
+        pad = max(1.0, (max(limits) - min(limits)) * 0.1)
+        self.vmin = min(limits) - pad
+        self.vmax = max(limits) + pad
+
+        c = self.canvas
+        c.delete('all')
+        self.items = [None] * PLOT_WIDTH
+        x0, x1 = MARGIN_LEFT, MARGIN_LEFT + PLOT_WIDTH
+        c.create_rectangle(x0, MARGIN_TOP, x1, MARGIN_TOP + PLOT_HEIGHT, outline='grey')
+        for limit, color in ((limits[0], 'cyan'), (limits[1], 'crimson')):
+            y = self._y(limit)
+            c.create_line(x0, y, x1, y, fill=color, dash=(4, 2))
+            c.create_text(x0 - 4, y, text="{0:.1f}".format(limit), anchor='e', font=('Arial', 8))
+        c.create_text(x0 - 4, MARGIN_TOP, text="{0:.1f}".format(self.vmax), anchor='ne', font=('Arial', 8))
+        c.create_text(x0 - 4, MARGIN_TOP + PLOT_HEIGHT, text="{0:.1f}".format(self.vmin),
+                      anchor='se', font=('Arial', 8))
+        fmt = "%H:%M" if self.span <= 86400 else "%Y-%m-%d"
+        c.create_text(x0, MARGIN_TOP + PLOT_HEIGHT + 15, anchor='w', font=('Arial', 8),
+                      text=time.strftime(fmt, time.localtime(self.t0)))
+        c.create_text(x1, MARGIN_TOP + PLOT_HEIGHT + 15, anchor='e', font=('Arial', 8),
+                      text=time.strftime(fmt, time.localtime(self.t1)))
+        for x in range(PLOT_WIDTH):
+            self._draw_column(x)
+
+    def _draw_column(self, x: int):
+        if self.mins[x] is None:
+            return
+        px = MARGIN_LEFT + x
+        coords = (px, self._y(self.maxs[x]), px, self._y(self.mins[x]) + 1)
+        if self.items[x] is None:
+            self.items[x] = self.canvas.create_line(*coords, fill='navy', tags='trend')
+        else:
+            self.canvas.coords(self.items[x], *coords)
+
+    def _shift(self, columns: int):
+        """Scroll the plot left by whole pixel columns as time advances"""
+        columns = min(columns, PLOT_WIDTH)
+        for item in self.items[:columns]:
+            if item is not None:
+                self.canvas.delete(item)
+        self.canvas.move('trend', -columns, 0)
+        pad = [None] * columns
+        self.items = self.items[columns:] + pad
+        self.mins = self.mins[columns:] + pad
+        self.maxs = self.maxs[columns:] + pad
+        self.t0 += columns * self.step
+        self.t1 += columns * self.step
+
+    def poll(self):
+        """Fold the samples that arrived since the last poll into the plot"""
+        self._poll_id = self.win.after(POLL_MS, self.poll)
+        if self.loading:
+            return
+        now = time.time()
+        if now >= self.t1 + self.step:
+            self._shift(int((now - self.t1) / self.step))
+
+        times, values = self.recent(self.tid, self.last_ts)
+        changed = set()
+        rescale = False
+        for ts, value in zip(times, values):
+            if ts <= self.last_ts:
+                continue
+            self.last_ts = ts
+            x = min(int((ts - self.t0) / self.step), PLOT_WIDTH - 1)
+            if x < 0:
+                continue
+            if self.mins[x] is None:
+                self.mins[x] = self.maxs[x] = value
+            else:
+                self.mins[x] = min(self.mins[x], value)
+                self.maxs[x] = max(self.maxs[x], value)
+            changed.add(x)
+            rescale = rescale or not self.vmin <= value <= self.vmax
+        if rescale:
+            self._paint()
+        else:
+            for x in changed:
+                self._draw_column(x)